@@ -0,0 +1,171 @@
+from cache import TTLCache
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import tempfile
+import time
+import logging
+
+logger = logging.getLogger('waitress')
+
+# Maximum number of tags (annotations and frame properties) kept in memory by each process
+ANNOTATIONS_CACHE_TAGS = int(os.environ.get('ANNOTATIONS_CACHE_TAGS', 200000))
+
+# Seconds to keep the annotations of a task in memory and in the on-disk store
+ANNOTATIONS_CACHE_TTL = int(os.environ.get('ANNOTATIONS_CACHE_TTL', 24 * 60 * 60))
+
+# Directory of the on-disk store of the annotations, disabled when it is not set
+ANNOTATIONS_CACHE_DIR = os.environ.get('ANNOTATIONS_CACHE_DIR')
+
+# Maximum size in bytes of the on-disk store, the least recently used entries are evicted first
+ANNOTATIONS_CACHE_BYTES = int(os.environ.get('ANNOTATIONS_CACHE_BYTES', 2 * 1024 * 1024 * 1024))
+
+# Number of writes to the on-disk store between two evictions (see evictStore)
+ANNOTATIONS_CACHE_EVICT_WRITES = int(os.environ.get('ANNOTATIONS_CACHE_EVICT_WRITES', 16))
+
+# Annotations of the tasks by (task id, mode) -> (fingerprint, annotations)
+annotations_cache = TTLCache(maxsize=1024, ttl=ANNOTATIONS_CACHE_TTL, maxweight=ANNOTATIONS_CACHE_TAGS)
+
+# Single writer of the on-disk store: the requests don't wait for the writes and evictions, which never run concurrently
+store_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='annotations-store')
+
+# Entries waiting for the writer (task id, mode), an entry is queued once, and the number of writes done by the writer
+store_pending = set()
+store_writes = {'count' : 0}
+
+def storePath(taskId, mode):
+    """Get the path of the on-disk store of the annotations of a task"""
+    return os.path.join(ANNOTATIONS_CACHE_DIR, 'task_{}_{}.json'.format(taskId, mode))
+
+def readStore(taskId, mode, fingerprint):
+    """Read the annotations of a task from the on-disk store, expired entries are removed
+    :return: the annotations, or None if they are missing, expired or their fingerprint moved
+    """
+    path = storePath(taskId, mode)
+
+    try:
+        if time.time() - os.path.getmtime(path) > ANNOTATIONS_CACHE_TTL:
+            os.remove(path)
+            return None
+
+        with open(path) as storeFile:
+            entry = json.load(storeFile)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.error(e, exc_info=True)
+        return None
+
+    if entry.get('fingerprint') != fingerprint:
+        return None
+
+    # The modification time of an entry is its last use (see evictStore)
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+    return entry['annotations']
+
+def writeStore(taskId, mode, fingerprint, taskAnnotations):
+    """Write the annotations of a task to the on-disk store (atomically, readers never see a partial file).\n
+    It runs on the writer of the store (see setAnnotations), the store is evicted every ANNOTATIONS_CACHE_EVICT_WRITES writes
+    so it can exceed ANNOTATIONS_CACHE_BYTES by the entries written since the last eviction"""
+    store_pending.discard((taskId, mode))
+
+    try:
+        os.makedirs(ANNOTATIONS_CACHE_DIR, exist_ok=True)
+        descriptor, path = tempfile.mkstemp(dir=ANNOTATIONS_CACHE_DIR, suffix='.tmp')
+
+        try:
+            with os.fdopen(descriptor, 'w') as storeFile:
+                json.dump({'fingerprint' : fingerprint, 'annotations' : taskAnnotations}, storeFile, separators=(',', ':'))
+
+            os.replace(path, storePath(taskId, mode))
+        except BaseException:
+            os.remove(path)
+            raise
+
+        store_writes['count'] += 1
+
+        if store_writes['count'] % ANNOTATIONS_CACHE_EVICT_WRITES == 0:
+            evictStore()
+    except Exception as e:
+        # Nobody waits for the writer, its errors are only logged
+        logger.error(e, exc_info=True)
+
+def evictStore():
+    """Remove the expired entries of the on-disk store, then the least recently used entries
+    until the store fits in ANNOTATIONS_CACHE_BYTES"""
+    now = time.time()
+    entries = []
+
+    for name in os.listdir(ANNOTATIONS_CACHE_DIR):
+        if not name.endswith('.json'):
+            continue
+
+        path = os.path.join(ANNOTATIONS_CACHE_DIR, name)
+
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    entries.sort()
+    size = sum(entry[1] for entry in entries)
+
+    for mtime, entrySize, path in entries:
+        if size <= ANNOTATIONS_CACHE_BYTES and now - mtime <= ANNOTATIONS_CACHE_TTL:
+            continue
+
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+        size -= entrySize
+
+def getAnnotations(taskId, mode, fingerprint):
+    """Get the cached annotations of a task
+    :param taskId: the id of the task
+    :param mode: see api.tags.getTagsFromDB
+    :param fingerprint: the current fingerprint of the task (see api.shapes.loadTaskFingerprint)
+    :return: the annotations (see api.tags.buildTaskAnnotations), or None if they are not cached for this fingerprint
+    """
+    if fingerprint is None:
+        return None
+
+    key = (taskId, mode)
+    entry = annotations_cache.get(key)
+
+    if entry is not None:
+        if entry[0] == fingerprint:
+            return entry[1]
+
+        annotations_cache.invalidate(key)
+
+    if ANNOTATIONS_CACHE_DIR:
+        taskAnnotations = readStore(taskId, mode, fingerprint)
+
+        if taskAnnotations is not None:
+            annotations_cache.set(key, (fingerprint, taskAnnotations), weight=annotationsWeight(taskAnnotations))
+            return taskAnnotations
+
+    return None
+
+def setAnnotations(taskId, mode, fingerprint, taskAnnotations):
+    """Cache the annotations of a task for its fingerprint (see getAnnotations)"""
+    if fingerprint is None:
+        return
+
+    annotations_cache.set((taskId, mode), (fingerprint, taskAnnotations), weight=annotationsWeight(taskAnnotations))
+
+    if ANNOTATIONS_CACHE_DIR and (taskId, mode) not in store_pending:
+        store_pending.add((taskId, mode))
+        store_executor.submit(writeStore, taskId, mode, fingerprint, taskAnnotations)
+
+def annotationsWeight(taskAnnotations):
+    """Get the weight of annotations in the cache: their number of tags"""
+    return len(taskAnnotations['annotations']) + len(taskAnnotations['frameProperties']) + 1
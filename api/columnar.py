@@ -0,0 +1,200 @@
+import io
+import numpy as np
+from api import interpolation
+
+class Dictionary(object):
+    """Dictionary encoding of values: every distinct value gets the next code"""
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def code(self, value):
+        """Get the code of a value"""
+        code = self.codes.get(value)
+
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+
+        return code
+
+class Dictionaries(object):
+    """Dictionaries shared by the columns of all the tasks of an export"""
+
+    def __init__(self):
+        self.sources = Dictionary()
+        self.classes = Dictionary()
+        self.names = Dictionary()
+        self.values = Dictionary()
+        self.propertySets = Dictionary()
+
+    def propertiesCode(self, properties):
+        """Get the code of a set of properties ({name: value}), -1 for no properties"""
+        if properties is None:
+            return -1
+
+        return self.propertySets.code(tuple(sorted(properties.items())))
+
+    def columns(self):
+        """Get the dictionary columns and the table of the properties of every properties set"""
+        table = [(code, self.names.code(name), self.values.code(value))
+                 for code, properties in enumerate(self.propertySets.values)
+                 for name, value in properties]
+
+        return {
+            'sources': np.array(self.sources.values, dtype=str),
+            'classes': np.array(self.classes.values, dtype=str),
+            'properties_set': np.array([row[0] for row in table], dtype=np.int32),
+            'properties_name': np.array([row[1] for row in table], dtype=np.int32),
+            'properties_value': np.array([row[2] for row in table], dtype=np.int32),
+            'property_names': np.array(self.names.values, dtype=str),
+            'property_values': np.array(self.values.values, dtype=str)
+        }
+
+def boxColumns(task, shapes, size, mode, dictionaries):
+    """Get the box columns of a task: the completed frames (or the key frames) of the tracked boxes
+    followed by the labeled boxes
+    :param task: the task (see api.tags.findTask)
+    :param shapes: the shapes of the job of the task (see api.shapes.loadJobShapes)
+    :param size: the size of the task
+    :param mode: 'frames' or 'keyframes' (see api.tags.getTagsFromDB)
+    :param dictionaries: the dictionaries of the export
+    :return: dictionary of columns
+    """
+    keyFrames = interpolation.trackedBoxKeyFrames(shapes['trackedBox'], shapes['trackedBoxAttributes'])
+    classes = np.array([dictionaries.classes.code(label) for label in keyFrames['class']], dtype=np.int32)
+    properties = np.array([dictionaries.propertiesCode(props) for props in keyFrames['properties']], dtype=np.int32)
+
+    if mode == 'keyframes':
+        key = np.arange(len(classes))
+        frames = keyFrames['frame']
+        boxes = keyFrames['box']
+        outside = keyFrames['outside']
+        trackProperties = properties
+    else:
+        interpolated = interpolation.interpolateBoxes(keyFrames, size)
+        key = interpolated['key']
+        frames = interpolated['frame']
+        boxes = interpolated['box']
+        outside = np.zeros(len(key), dtype=bool)
+
+        # Boxes between two key frames have no properties (see interpolation.boxesToDicts)
+        trackProperties = np.where((interpolated['offset'] == 0) | interpolated['last'], properties[key], -1)
+
+    labeled = shapes['labeledBox']
+    attributes = shapes['labeledBoxAttributes']
+    labeledBoxes = np.array([(row.xtl, row.ytl, row.xbr, row.ybr) for row in labeled], dtype=np.float64).reshape(-1, 4)
+    boxes = np.concatenate([boxes, labeledBoxes])
+
+    return {
+        'task': np.full(len(frames) + len(labeled), dictionaries.sources.code(task['source']), dtype=np.int32),
+        'frame': np.concatenate([frames, np.array([row.frame for row in labeled], dtype=np.int64)]),
+        'track_id': np.concatenate([keyFrames['track_id'][key], np.full(len(labeled), -1, dtype=np.int64)]),
+        'class': np.concatenate([classes[key], np.array([dictionaries.classes.code(row.label) for row in labeled], dtype=np.int32)]),
+        'xtl': boxes[:, 0],
+        'ytl': boxes[:, 1],
+        'xbr': boxes[:, 2],
+        'ybr': boxes[:, 3],
+        'outside': np.concatenate([outside, np.zeros(len(labeled), dtype=bool)]),
+        'properties': np.concatenate([trackProperties,
+                                      np.array([dictionaries.propertiesCode(attributes.get(row.id, {})) for row in labeled], dtype=np.int32)])
+    }
+
+# Point shape types of the shape columns, the code of a type (shape_type) is its index in shape_types
+POINT_SHAPE_TYPES = ['Polygon', 'Polyline', 'Points']
+
+def pointShapeColumns(task, shapes, size, mode, dictionaries):
+    """Get the polygon, polyline and points columns of a task: for every type, the completed frames (or the key frames)
+    of the tracked shapes followed by the labeled shapes. The points of shape i are shape_points[shape_offsets[i]:shape_offsets[i + 1]]
+    :param task: the task (see api.tags.findTask)
+    :param shapes: the shapes of the job of the task (see api.shapes.loadJobShapes)
+    :param size: the size of the task
+    :param mode: 'frames' or 'keyframes' (see api.tags.getTagsFromDB)
+    :param dictionaries: the dictionaries of the export
+    :return: dictionary of columns
+    """
+    tables = []
+
+    for code, shapeType in enumerate(POINT_SHAPE_TYPES):
+        keyFrames = interpolation.trackedPointsKeyFrames(shapes['tracked' + shapeType], shapes['tracked{}Attributes'.format(shapeType)])
+        classes = np.array([dictionaries.classes.code(label) for label in keyFrames['class']], dtype=np.int32)
+        properties = np.array([dictionaries.propertiesCode(props) for props in keyFrames['properties']], dtype=np.int32)
+
+        if mode == 'keyframes':
+            key = np.arange(len(classes))
+            frames = keyFrames['frame']
+            points = keyFrames['points']
+            offsets = keyFrames['offsets']
+            outside = keyFrames['outside']
+            trackProperties = properties
+        else:
+            completed = interpolation.interpolatePoints(keyFrames, size)
+            key = completed['key']
+            frames = completed['frame']
+            points = completed['points']
+            offsets = completed['offsets']
+            outside = np.zeros(len(key), dtype=bool)
+
+            # Shapes between two key frames have no properties (see interpolation.pointsToDicts)
+            trackProperties = np.where((completed['offset'] == 0) | completed['last'], properties[key], -1)
+
+        labeled = shapes['labeled' + shapeType]
+        attributes = shapes['labeled{}Attributes'.format(shapeType)]
+        labeledPoints, labeledOffsets = interpolation.parsePoints([row.points for row in labeled])
+        count = len(frames) + len(labeled)
+
+        tables.append({
+            'shape_task': np.full(count, dictionaries.sources.code(task['source']), dtype=np.int32),
+            'shape_type': np.full(count, code, dtype=np.int32),
+            'shape_frame': np.concatenate([frames, np.array([row.frame for row in labeled], dtype=np.int64)]),
+            'shape_track_id': np.concatenate([keyFrames['track_id'][key], np.full(len(labeled), -1, dtype=np.int64)]),
+            'shape_class': np.concatenate([classes[key], np.array([dictionaries.classes.code(row.label) for row in labeled], dtype=np.int32)]),
+            'shape_outside': np.concatenate([outside, np.zeros(len(labeled), dtype=bool)]),
+            'shape_properties': np.concatenate([trackProperties,
+                                                np.array([dictionaries.propertiesCode(attributes.get(row.id, {})) for row in labeled], dtype=np.int32)]),
+            'shape_count': np.concatenate([np.diff(offsets), np.diff(labeledOffsets)]).astype(np.int64),
+            'shape_points': np.concatenate([points, labeledPoints])
+        })
+
+    return concatenateColumns(tables)
+
+def framePropertyColumns(task, spans, dictionaries):
+    """Get the frame property columns of a task, each row is a property value from frame (included) to stop (excluded)
+    :param task: the task (see api.tags.findTask)
+    :param spans: the key frames of the frame properties with their stop frame (see api.tags.framePropertiesSpans)
+    :param dictionaries: the dictionaries of the export
+    :return: dictionary of columns
+    """
+    spans = [(keyFrame, stop) for keyFrame, stop in spans if keyFrame['frame'] < stop]
+
+    return {
+        'frame_property_task': np.full(len(spans), dictionaries.sources.code(task['source']), dtype=np.int32),
+        'frame_property_frame': np.array([keyFrame['frame'] for keyFrame, stop in spans], dtype=np.int64),
+        'frame_property_stop': np.array([stop for keyFrame, stop in spans], dtype=np.int64),
+        'frame_property_name': np.array([dictionaries.names.code(keyFrame['prop']) for keyFrame, stop in spans], dtype=np.int32),
+        'frame_property_value': np.array([dictionaries.values.code(keyFrame[keyFrame['prop']]) for keyFrame, stop in spans], dtype=np.int32)
+    }
+
+def concatenateColumns(tables):
+    """Concatenate the columns of several tasks"""
+    return {name: np.concatenate([table[name] for table in tables]) for name in tables[0]}
+
+def annotationsNpz(tasksColumns, dictionaries):
+    """Write the columns of all the tasks of an export as a compressed npz archive
+    :param tasksColumns: list of the columns of each task (dictionaries of columns)
+    :param dictionaries: the dictionaries of the export
+    :return: the bytes of the archive
+    """
+    columns = concatenateColumns(tasksColumns)
+
+    # Offsets of the points of each polygon, polyline or points
+    columns['shape_offsets'] = np.concatenate([[0], np.cumsum(columns.pop('shape_count'))]).astype(np.int64)
+    columns['shape_types'] = np.array([shapeType.lower() for shapeType in POINT_SHAPE_TYPES], dtype=str)
+    columns.update(dictionaries.columns())
+
+    payload = io.BytesIO()
+    np.savez_compressed(payload, **columns)
+
+    return payload.getvalue()
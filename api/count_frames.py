@@ -1,16 +1,25 @@
 import models
 from flask import jsonify
+from sqlalchemy import func
+from sqlalchemy.orm import aliased
 import requestsApi as rqApi
 import traceback
 import logging
 
 logger = logging.getLogger('waitress')
 
+# Date buckets of the tasks (see taskGroups)
+DATE_BUCKETS = ['day', 'week', 'month']
+
+# Date columns of the tasks which can be bucketed
+DATE_COLUMNS = ['created_date', 'updated_date']
+
 def getCountFinishFramesRequest(data):
     """Get the count of finish frames in specific project\n
         params:
-            data: json contains task and project name
-        return: number of frames (string)
+            data: json contains task and project name, and optionally group_by (comma separated status, assignee,
+                  day, week or month) and date_column (created_date or updated_date, the date of the buckets)
+        return: number of frames (string), or the number of frames and tasks of every group (json array)
     """
         
     missingParam = rqApi.checkIfParamsExist(data, ['project.name'])
@@ -18,13 +27,80 @@ def getCountFinishFramesRequest(data):
     if missingParam != "":
         return jsonify({'message' :  missingParam + ' is missing!'}), 401
 
-    tasks = rqApi.getRequest(data, models.Task)
     try :
-        tasks = rqApi.parseBytesToJson(tasks.get_data())
-        totalFrames = 0
-        for task in tasks:
-            totalFrames+=task['size']
-        return str(totalFrames), 200
+        groupBy = [group for group in data.get('group_by', '').split(',') if group != '']
+        counts = aggregateFrames(data, groupBy, data.get('date_column', 'created_date'))
+
+        if len(groupBy) == 0:
+            return str(counts[0]['total_frames']), 200
+
+        return jsonify(counts), 200
+    except rqApi.QueryError as e:
+        return jsonify({'message' : str(e)}), 400
     except Exception as e:
         logger.error(e, exc_info=True)
-        return jsonify({'message' : 'There is no count of frames to show !'})
\ No newline at end of file
+        return jsonify({'message' : 'There is no count of frames to show !'})
+
+def taskGroups(groupBy, dateColumn):
+    """Get the columns of the groups of tasks
+        params:
+            groupBy: list of groups: status, assignee (username) or a date bucket (see DATE_BUCKETS)
+            dateColumn: the date column of the date buckets (see DATE_COLUMNS)
+    :raise QueryError: if a group or the date column is not valid
+    :return: tuple of (list of labeled group columns, list of (model, condition) outer joins)
+    """
+    Task = models.Task
+    Assignee = aliased(models.User)
+    columns = []
+    joins = []
+
+    if dateColumn not in DATE_COLUMNS:
+        raise rqApi.QueryError('date_column must be one of {}!'.format(', '.join(DATE_COLUMNS)))
+
+    for group in groupBy:
+        if group == 'status':
+            columns.append(Task.status.label(group))
+        elif group == 'assignee':
+            columns.append(Assignee.username.label(group))
+            joins.append((Assignee, Assignee.id == Task.assignee_id))
+        elif group in DATE_BUCKETS:
+            columns.append(func.date_trunc(group, getattr(Task, dateColumn)).label(group))
+        else:
+            raise rqApi.QueryError('{} is not a group of tasks!'.format(group))
+
+    return columns, joins
+
+def aggregateFrames(filters, groupBy=[], dateColumn='created_date'):
+    """Sum the frames and count the tasks of the filters for every group, in the database
+        params:
+            filters: the filters of the tasks (see rqApi.buildQuery)
+            groupBy: see taskGroups, no groups for the totals of all the tasks
+            dateColumn: see taskGroups
+    :return: list of dictionaries with the value of every group, total_frames and tasks (dates are iso dates)
+    """
+    Task = models.Task
+    columns, joins = taskGroups(groupBy, dateColumn)
+
+    query = rqApi.buildQuery(filters, Task)
+
+    for model, condition in joins:
+        query = query.outerjoin(model, condition)
+
+    query = query.with_entities(*columns,
+                                func.coalesce(func.sum(Task.size), 0).label('total_frames'),
+                                func.count(Task.id).label('tasks'))
+
+    if len(columns) != 0:
+        query = query.group_by(*columns).order_by(*columns)
+
+    counts = []
+    for row in query.all():
+        count = row._asdict()
+
+        for bucket in DATE_BUCKETS:
+            if hasattr(count.get(bucket), 'isoformat'):
+                count[bucket] = count[bucket].date().isoformat()
+
+        counts.append(count)
+
+    return counts
@@ -0,0 +1,345 @@
+import numpy as np
+
+# Number of completed frames materialized as dictionaries at once (see boxesToDicts)
+DICTS_CHUNK_SIZE = 65536
+
+def mergeProperties(prevProps, currentProps):
+    """Merge the properties of a key frame into the properties of the previous key frame
+    :param prevProps: properties of the previous key frame
+    :param currentProps: properties of the current key frame
+    :return: dictionary with all properties
+    """
+    props = dict(prevProps)
+    props.update(currentProps)
+
+    return props
+
+def trackKeyFrames(rows, attributes):
+    """Build the key frame arrays shared by all the tracked shape types
+    :param rows: tracked shape rows (see api.shapes.loadJobShapes)
+    :param attributes: properties of each tracked shape by its id
+    :return: tuple of (dictionary of key frame arrays, rows), sorted by track and frame
+    """
+    rows = sorted(rows, key=lambda row : (row.track_id, row.frame))
+
+    keyFrames = {
+        'track_id': np.array([row.track_id for row in rows], dtype=np.int64),
+        'frame': np.array([row.frame for row in rows], dtype=np.int64),
+        'outside': np.array([bool(row.outside) for row in rows], dtype=bool),
+        'class': [row.label for row in rows],
+        'properties': [attributes.get(row.id, {}) for row in rows]
+    }
+
+    # The properties of a key frame are inherited from the previous key frames of the track,
+    # except for the last key frame of the track
+    properties = keyFrames['properties']
+    tracks = keyFrames['track_id'].tolist()
+
+    for i in range(1, len(rows) - 1):
+        if tracks[i] == tracks[i - 1] and tracks[i] == tracks[i + 1]:
+            properties[i] = mergeProperties(properties[i - 1], properties[i])
+
+    return keyFrames, rows
+
+def trackedBoxKeyFrames(rows, attributes):
+    """Build the key frame arrays of tracked boxes
+    :param rows: tracked box rows (see api.shapes.loadJobShapes)
+    :param attributes: properties of each tracked box by its id
+    :return: dictionary of key frame arrays, sorted by track and frame
+    """
+    keyFrames, rows = trackKeyFrames(rows, attributes)
+    keyFrames['box'] = np.array([(row.xtl, row.ytl, row.xbr, row.ybr) for row in rows], dtype=np.float64).reshape(-1, 4)
+
+    return keyFrames
+
+def parsePoints(texts):
+    """Parse point lists into one flat array of vertices
+    :param texts: point lists (for example: '1.5,2 3,4.5 5,6')
+    :return: tuple of (vertices array of shape (N, 2), offsets array), the vertices of the point list i are
+             vertices[offsets[i]:offsets[i + 1]]
+    """
+    counts = [len(text.split()) for text in texts]
+    vertices = np.array(' '.join(texts).replace(',', ' ').split(), dtype=np.float64).reshape(-1, 2)
+
+    return vertices, np.concatenate([[0], np.cumsum(counts, dtype=np.int64)]).astype(np.int64)
+
+def trackedPointsKeyFrames(rows, attributes):
+    """Build the key frame arrays of tracked polygons, polylines or points
+    :param rows: tracked polygon, polyline or points rows (see api.shapes.loadJobShapes)
+    :param attributes: properties of each tracked shape by its id
+    :return: dictionary of key frame arrays, sorted by track and frame, with the points of every key frame (see parsePoints)
+    """
+    keyFrames, rows = trackKeyFrames(rows, attributes)
+    keyFrames['points'], keyFrames['offsets'] = parsePoints([row.points for row in rows])
+
+    return keyFrames
+
+def keyFrameMargins(keyFrames, size):
+    """Get the number of frames covered by each key frame
+    A key frame covers the frames until the next key frame of its track, the last key frame of a track
+    covers the frames until the end of the video, and every key frame covers at least itself.
+    :param keyFrames: key frame arrays (see trackedBoxKeyFrames)
+    :param size: the size of the job
+    :return: tuple of (is last key frame of its track, number of covered frames) arrays
+    """
+    tracks = keyFrames['track_id']
+    frames = keyFrames['frame']
+    count = len(frames)
+
+    isLast = np.ones(count, dtype=bool)
+    isLast[:-1] = tracks[:-1] != tracks[1:]
+
+    nextFrames = np.empty(count, dtype=np.int64)
+    nextFrames[:-1] = frames[1:]
+    nextFrames[isLast] = size
+
+    return isLast, np.maximum(nextFrames - frames, 1)
+
+def completeFrames(keyFrames, size):
+    """Get the frames covered by every key frame which is not outside
+    :param keyFrames: key frame arrays (see trackKeyFrames)
+    :param size: the size of the job
+    :return: dictionary of arrays with a row per completed frame: the index of its key frame, its offset from the
+             key frame, its frame, if its key frame is the last of its track, and the number of frames covered by its key frame
+    """
+    frames = keyFrames['frame']
+    isLast, margin = keyFrameMargins(keyFrames, size)
+
+    visible = np.nonzero(~keyFrames['outside'])[0]
+    counts = margin[visible]
+    keyIndex = np.repeat(visible, counts)
+    offset = np.arange(counts.sum(), dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    return {
+        'key': keyIndex,
+        'offset': offset,
+        'frame': frames[keyIndex] + offset,
+        'last': isLast[keyIndex],
+        'margin': margin[keyIndex]
+    }
+
+def interpolateBoxes(keyFrames, size):
+    """Complete all the frames of all the tracks of a job
+    Every key frame which is not outside is followed by the linear interpolation of the box until the next
+    key frame of the track, and the last key frame of a track holds its box until the end of the video.
+    :param keyFrames: key frame arrays (see trackedBoxKeyFrames)
+    :param size: the size of the job
+    :return: dictionary of arrays with a row per completed frame
+    """
+    boxes = keyFrames['box']
+    isLast, margin = keyFrameMargins(keyFrames, size)
+
+    nextBoxes = np.empty_like(boxes)
+    nextBoxes[:-1] = boxes[1:]
+    nextBoxes[isLast] = boxes[isLast]
+
+    distance = (nextBoxes - boxes) / margin[:, None]
+
+    completed = completeFrames(keyFrames, size)
+    keyIndex = completed['key']
+    completed['box'] = distance[keyIndex] * completed['offset'][:, None] + boxes[keyIndex]
+
+    return completed
+
+def interpolatePoints(keyFrames, size):
+    """Interpolate all the frames of all the point tracks of a job at once
+    The vertices of a key frame move linearly to the vertices of the next key frame of the track when both have
+    the same number of vertices, otherwise (and after the last key frame) the key frame holds its points until the next one.
+    :param keyFrames: key frame arrays (see trackedPointsKeyFrames)
+    :param size: the size of the job
+    :return: dictionary of arrays with a row per completed frame (see completeFrames) and the points of every row
+             (points and offsets, see parsePoints)
+    """
+    points = keyFrames['points']
+    offsets = keyFrames['offsets']
+    counts = offsets[1:] - offsets[:-1]
+    isLast, margin = keyFrameMargins(keyFrames, size)
+
+    # Key frames which move to the next key frame of their track
+    moving = ~isLast
+    moving[:-1] &= counts[:-1] == counts[1:]
+
+    completed = completeFrames(keyFrames, size)
+    keyIndex = completed['key']
+
+    # The vertices of every row are gathered from the vertices of its key frame and of the next key frame
+    rowCounts = counts[keyIndex]
+    rowOffsets = np.concatenate([[0], np.cumsum(rowCounts, dtype=np.int64)]).astype(np.int64)
+    vertex = np.repeat(offsets[keyIndex] - rowOffsets[:-1], rowCounts) + np.arange(rowOffsets[-1], dtype=np.int64)
+    nextVertex = vertex + np.repeat(np.where(moving[keyIndex], rowCounts, 0), rowCounts)
+
+    weight = np.repeat(np.where(moving[keyIndex], completed['offset'] / margin[keyIndex], 0.0), rowCounts)
+
+    completed['points'] = points[vertex] + (points[nextVertex] - points[vertex]) * weight[:, None]
+    completed['offsets'] = rowOffsets
+
+    return completed
+
+def gatherObjects(values, index):
+    """Gather python objects by an index array in one pass
+    :param values: list of python objects
+    :param index: array of indexes in values
+    :return: list of values[i] for every i of index
+    """
+    objects = np.empty(len(values), dtype=object)
+    objects[:] = values
+
+    return objects[index].tolist()
+
+def boxesToDicts(keyFrames, interpolated):
+    """Materialize the completed frames as tracked box dictionaries
+    The columns are converted to lists in bulk and the dictionaries are built by a comprehension for every chunk
+    of DICTS_CHUNK_SIZE rows, then the properties are set on the rows which have them.
+    :param keyFrames: key frame arrays (see trackedBoxKeyFrames)
+    :param interpolated: completed frame arrays (see interpolateBoxes)
+    :return: generator of tracked box dictionaries
+    """
+    properties = keyFrames['properties']
+    classes = keyFrames['class']
+    tracks = keyFrames['track_id']
+    boxes = interpolated['box']
+
+    # Boxes between two key frames have no properties
+    withProperties = (interpolated['offset'] == 0) | interpolated['last']
+
+    for start in range(0, len(interpolated['key']), DICTS_CHUNK_SIZE):
+        key = interpolated['key'][start:start + DICTS_CHUNK_SIZE]
+        chunk = boxes[start:start + DICTS_CHUNK_SIZE]
+
+        rows = [{
+            "frame" : frame,
+            "class" : label,
+            "track_id" : track,
+            "box": {
+                "xbr" : xbr,
+                "xtl" : xtl,
+                "ybr" : ybr,
+                "ytl" : ytl
+            }
+        } for frame, label, track, xtl, ytl, xbr, ybr in zip(interpolated['frame'][start:start + DICTS_CHUNK_SIZE].tolist(),
+                                                             gatherObjects(classes, key),
+                                                             tracks[key].tolist(),
+                                                             chunk[:, 0].tolist(),
+                                                             chunk[:, 1].tolist(),
+                                                             chunk[:, 2].tolist(),
+                                                             chunk[:, 3].tolist())]
+
+        rowsWithProperties = np.nonzero(withProperties[start:start + DICTS_CHUNK_SIZE])[0]
+
+        for i, props in zip(rowsWithProperties.tolist(), gatherObjects(properties, key[rowsWithProperties])):
+            rows[i]["properties"] = props
+
+        yield from rows
+
+def pointsToDicts(keyFrames, completed, geometry):
+    """Materialize the completed frames as tracked polygon, polyline or points dictionaries
+    :param keyFrames: key frame arrays (see trackedPointsKeyFrames)
+    :param completed: completed frame arrays (see interpolatePoints)
+    :param geometry: function of a list of [x, y] coordinates -> GeoJSON geometry dictionary
+    :return: generator of tracked shape dictionaries
+    """
+    classes = keyFrames['class']
+    properties = keyFrames['properties']
+    tracks = keyFrames['track_id'].tolist()
+    points = completed['points'].tolist()
+    offsets = completed['offsets'].tolist()
+
+    # Shapes between two key frames have no properties
+    withProperties = (completed['offset'] == 0) | completed['last']
+
+    for i, (key, frame, hasProperties) in enumerate(zip(completed['key'].tolist(),
+                                                        completed['frame'].tolist(),
+                                                        withProperties.tolist())):
+        track = {
+            "frame" : frame,
+            "class" : classes[key],
+            "track_id" : tracks[key],
+            "geometry" : geometry(points[offsets[i]:offsets[i + 1]])
+        }
+
+        if hasProperties:
+            track["properties"] = properties[key]
+
+        yield track
+
+def boxTracksToDicts(keyFrames, size):
+    """Materialize the box tracks as their key frames and the spans of frames they are visible in
+    :param keyFrames: key frame arrays (see trackedBoxKeyFrames)
+    :param size: the size of the job
+    :return: generator of track dictionaries
+    """
+    boxes = [{
+        "xbr" : xbr,
+        "xtl" : xtl,
+        "ybr" : ybr,
+        "ytl" : ytl
+    } for xtl, ytl, xbr, ybr in keyFrames['box'].tolist()]
+
+    return tracksToDicts(keyFrames, size, 'box', boxes)
+
+def pointTracksToDicts(keyFrames, size, geometry):
+    """Materialize the polygon, polyline or points tracks as their key frames and the spans of frames they are visible in
+    :param keyFrames: key frame arrays (see trackedPointsKeyFrames)
+    :param size: the size of the job
+    :param geometry: function of a list of [x, y] coordinates -> GeoJSON geometry dictionary
+    :return: generator of track dictionaries
+    """
+    points = keyFrames['points'].tolist()
+    offsets = keyFrames['offsets'].tolist()
+    geometries = [geometry(points[offsets[i]:offsets[i + 1]]) for i in range(len(offsets) - 1)]
+
+    return tracksToDicts(keyFrames, size, 'geometry', geometries)
+
+def tracksToDicts(keyFrames, size, shapeKey, shapes):
+    """Materialize the tracks as their key frames and the spans of frames they are visible in
+    :param keyFrames: key frame arrays (see trackKeyFrames)
+    :param size: the size of the job
+    :param shapeKey: the key of the shape in the key frame dictionaries
+    :param shapes: the shape of every key frame
+    :return: generator of track dictionaries
+    """
+    isLast, margin = keyFrameMargins(keyFrames, size)
+    visible = ~keyFrames['outside']
+    frames = keyFrames['frame']
+    stops = frames + margin
+
+    # Visible key frames which start where the previous visible key frame of the track stops
+    # continue its span
+    continued = np.zeros(len(frames), dtype=bool)
+    continued[1:] = ~isLast[:-1] & visible[:-1] & visible[1:] & (stops[:-1] == frames[1:])
+
+    classes = keyFrames['class']
+    properties = keyFrames['properties']
+    track = None
+
+    for i, (trackId, frame, stop, outside, isContinued) in enumerate(zip(keyFrames['track_id'].tolist(),
+                                                                         frames.tolist(),
+                                                                         stops.tolist(),
+                                                                         keyFrames['outside'].tolist(),
+                                                                         continued.tolist())):
+        if track is None or track['track_id'] != trackId:
+            if track is not None:
+                yield track
+
+            track = {
+                "track_id" : trackId,
+                "class" : classes[i],
+                "keyframes" : [],
+                "spans" : []
+            }
+
+        track['keyframes'].append({
+            "frame" : frame,
+            "outside" : outside,
+            "properties" : properties[i],
+            shapeKey : shapes[i]
+        })
+
+        if not outside:
+            if isContinued:
+                track['spans'][-1][1] = stop
+            else:
+                track['spans'].append([frame, stop])
+
+    if track is not None:
+        yield track
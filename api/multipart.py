@@ -0,0 +1,87 @@
+import io
+import os
+import mimetypes
+import uuid
+
+# Size of the chunks of the body when it is iterated
+CHUNK_SIZE = int(os.environ.get('MULTIPART_CHUNK_SIZE', 1024 * 1024))
+
+class MultipartStream(object):
+    """multipart/form-data body of fields and files which is read chunk by chunk, the files are never loaded in memory.\n
+    It is a file-like object with a length, so requests sends it with a Content-Length header
+    and reads it block by block (see api.task.postTask)."""
+
+    def __init__(self, fields, files, boundary=None):
+        """
+        :param fields: dictionary of the form fields, values are sent as strings
+        :param files: list of (field name, file) where file is a werkzeug FileStorage or has filename and stream
+        :param boundary: the boundary of the parts, random by default
+        """
+        self.boundary = boundary or uuid.uuid4().hex
+        self.parts = []
+
+        for name, value in fields.items():
+            self.addBytes('--{}\r\nContent-Disposition: form-data; name="{}"\r\n\r\n'.format(self.boundary, quote(name)).encode()
+                          + str(value).encode() + b'\r\n')
+
+        for name, uploaded in files:
+            contentType = mimetypes.guess_type(uploaded.filename)[0] or 'application/octet-stream'
+            self.addBytes('--{}\r\nContent-Disposition: form-data; name="{}"; filename="{}"\r\nContent-Type: {}\r\n\r\n'
+                          .format(self.boundary, quote(name), quote(uploaded.filename), contentType).encode())
+            self.addFile(uploaded.stream)
+            self.addBytes(b'\r\n')
+
+        self.addBytes('--{}--\r\n'.format(self.boundary).encode())
+
+        self.length = sum(size for part, size in self.parts)
+        self.current = 0
+
+    @property
+    def content_type(self):
+        """The Content-Type header of the body"""
+        return 'multipart/form-data; boundary={}'.format(self.boundary)
+
+    def addBytes(self, value):
+        self.parts.append((io.BytesIO(value), len(value)))
+
+    def addFile(self, stream):
+        """Add a file to the body from its start, its size is the size of the seekable stream"""
+        stream.seek(0, io.SEEK_END)
+        size = stream.tell()
+        stream.seek(0)
+
+        self.parts.append((stream, size))
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=-1):
+        """Read at most size bytes of the body (all the rest when size is negative), b'' at the end"""
+        chunks = []
+
+        while self.current < len(self.parts) and size != 0:
+            chunk = self.parts[self.current][0].read(size)
+
+            if not chunk:
+                self.current += 1
+                continue
+
+            chunks.append(chunk)
+
+            if size > 0:
+                size -= len(chunk)
+
+        return b''.join(chunks)
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(CHUNK_SIZE)
+
+            if not chunk:
+                return
+
+            yield chunk
+
+def quote(value):
+    """Quote a name or filename of a Content-Disposition header (like browsers do)"""
+    return value.replace('"', '%22').replace('\r', '%0D').replace('\n', '%0A')
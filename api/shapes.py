@@ -0,0 +1,211 @@
+import models
+import app
+from sqlalchemy import func, inspect, literal, literal_column, cast, null, type_coerce, Boolean, Float, Integer, Text
+from collections import defaultdict
+import logging
+
+logger = logging.getLogger('waitress')
+
+def parseAttributeName(text):
+    """Get the attribute name from the text of an attribute spec
+    :param text: text of the spec (for example: ~select=color:red,blue)
+    :return: the attribute name (for example: color)
+    """
+    startIndex = text.index('=') + 1
+
+    try:
+        endIndex = text.index(':')
+    except ValueError:
+        endIndex = len(text)
+
+    return text[startIndex : endIndex]
+
+def attributesByShape(rows):
+    """Group attribute values by the shape they belong to
+    :param rows: rows of (shape id, value, spec text)
+    :return: dictionary of shape id -> {attribute name: value}
+    """
+    attrs = defaultdict(dict)
+
+    for shapeId, value, text in rows:
+        try:
+            attrs[shapeId][parseAttributeName(text)] = value
+        except ValueError as e:
+            logger.error(e, exc_info=True)
+
+    return attrs
+
+# Shape types of a job: (name in the shapes of loadJobShapes, shape model, attribute value model, shape id column of the attribute values)
+SHAPE_TYPES = [
+    ('labeledBox', 'Labeledbox', 'Labeledboxattributeval', 'box_id'),
+    ('labeledPolygon', 'Labeledpolygon', 'Labeledpolygonattributeval', 'polygon_id'),
+    ('labeledPolyline', 'Labeledpolyline', 'Labeledpolylineattributeval', 'polyline_id'),
+    ('labeledPoints', 'Labeledpoints', 'Labeledpointsattributeval', 'points_id'),
+    ('trackedBox', 'Trackedbox', 'Trackedboxattributeval', 'box_id'),
+    ('trackedPolygon', 'Trackedpolygon', 'Trackedpolygonattributeval', 'polygon_id'),
+    ('trackedPolyline', 'Trackedpolyline', 'Trackedpolylineattributeval', 'polyline_id'),
+    ('trackedPoints', 'Trackedpoints', 'Trackedpointsattributeval', 'points_id')
+]
+
+# Names of the shape types whose tables are missing (see checkShapeTables), they are left out of the unions of loadJobShapes
+missing_shape_types = set()
+
+def checkShapeTables():
+    """Check that the tables of all the shape types (see SHAPE_TYPES) exist in the database,
+    a single missing table would fail the union of loadJobShapes for every job,
+    so the shape types of the missing tables are logged and left out of the union
+    """
+    tables = set(inspect(app.db.engine).get_table_names())
+    missing_shape_types.clear()
+
+    for name, shapeModel, attributeModel, shapeIdColumn in SHAPE_TYPES:
+        missing = [getattr(models, model).__tablename__ for model in [shapeModel, attributeModel]
+                   if getattr(models, model).__tablename__ not in tables]
+
+        if len(missing) != 0:
+            logger.error('The tables of the shape type {} are missing, its shapes are not exported: {}'.format(name, ', '.join(missing)))
+            missing_shape_types.add(name)
+
+def shapeColumn(Shape, name, columnType):
+    """Get a column of a shape model, or a typed null if the shape type doesn't have it (for the union of all the shape types)"""
+    if hasattr(Shape, name):
+        return getattr(Shape, name).label(name)
+
+    return cast(null(), columnType).label(name)
+
+def shapeId(column):
+    """Get the id column of a shape or attribute model for a union
+    (their ids are declared as foreign keys of the abstract base tables, which can't be copied to the union)"""
+    return type_coerce(column, Integer).label('id')
+
+def shapeJobFilter(query, Shape, jobId):
+    """Filter a query on a shape model by job: labeled shapes belong to the job, tracked shapes to a track of the job"""
+    if hasattr(Shape, 'track_id'):
+        return query.join(models.Objectpath, models.Objectpath.id == Shape.track_id) \
+                    .filter(models.Objectpath.job_id == jobId)
+
+    return query.filter(Shape.job_id == jobId)
+
+def loadJobShapes(jobId):
+    """Load all the shapes of a job with their attributes in two queries: a union of all the shape types
+    and a union of all their attribute values
+    :param jobId: the id of the job
+    :return: dictionary with the rows of every shape type (see SHAPE_TYPES) and their attributes by shape id
+             (<shape type>Attributes)
+    """
+    Label = models.Label
+    Objectpath = models.Objectpath
+    Attributespec = models.Attributespec
+
+    shapeQueries = []
+    attributeQueries = []
+
+    for name, shapeModel, attributeModel, shapeIdColumn in SHAPE_TYPES:
+        if name in missing_shape_types:
+            continue
+
+        Shape = getattr(models, shapeModel)
+        Attribute = getattr(models, attributeModel)
+        tracked = hasattr(Shape, 'track_id')
+
+        query = app.db.session.query(literal(name).label('type'),
+                                     shapeId(Shape.id),
+                                     Shape.frame.label('frame'),
+                                     shapeColumn(Shape, 'outside', Boolean),
+                                     shapeColumn(Shape, 'xtl', Float),
+                                     shapeColumn(Shape, 'ytl', Float),
+                                     shapeColumn(Shape, 'xbr', Float),
+                                     shapeColumn(Shape, 'ybr', Float),
+                                     shapeColumn(Shape, 'points', Text),
+                                     (Objectpath.id if tracked else cast(null(), Integer)).label('track_id'),
+                                     Label.name.label('label'))
+
+        # The label of a tracked shape is the label of its track
+        if tracked:
+            query = query.join(Objectpath, Objectpath.id == Shape.track_id) \
+                         .join(Label, Label.id == Objectpath.label_id) \
+                         .filter(Objectpath.job_id == jobId)
+        else:
+            query = query.join(Label, Label.id == Shape.label_id) \
+                         .filter(Shape.job_id == jobId)
+
+        shapeQueries.append(query)
+
+        attributeQueries.append(shapeJobFilter(
+            app.db.session.query(literal(name).label('type'),
+                                 shapeId(Attribute.id),
+                                 getattr(Attribute, shapeIdColumn).label('shape_id'),
+                                 Attribute.value.label('value'),
+                                 Attributespec.text.label('text'))
+            .join(Attributespec, Attributespec.id == Attribute.spec_id)
+            .join(Shape, Shape.id == getattr(Attribute, shapeIdColumn)), Shape, jobId))
+
+    shapes = {}
+
+    for name, shapeModel, attributeModel, shapeIdColumn in SHAPE_TYPES:
+        shapes[name] = []
+        shapes[name + 'Attributes'] = []
+
+    if len(shapeQueries) != 0:
+        for row in shapeQueries[0].union_all(*shapeQueries[1:]).order_by(literal_column('id')).all():
+            shapes[row.type].append(row)
+
+        for row in attributeQueries[0].union_all(*attributeQueries[1:]).order_by(literal_column('id')).all():
+            shapes[row.type + 'Attributes'].append((row.shape_id, row.value, row.text))
+
+    for name, shapeModel, attributeModel, shapeIdColumn in SHAPE_TYPES:
+        shapes[name + 'Attributes'] = attributesByShape(shapes[name + 'Attributes'])
+
+    return shapes
+
+def loadTaskKeyFrames(taskId):
+    """Load all the key frames of the frame properties of a task in one query
+    :param taskId: the id of the task
+    :return: rows of (frame, prop, value)
+    """
+    Keyframespec = models.Keyframespec
+    Taskframespec = models.Taskframespec
+    Frameproperties = models.Frameproperties
+
+    return app.db.session.query(Keyframespec.frame, Frameproperties.prop, Frameproperties.value) \
+        .join(Taskframespec, Taskframespec.id == Keyframespec.frameSpec_id) \
+        .join(Frameproperties, Frameproperties.id == Taskframespec.propVal_id) \
+        .filter(Taskframespec.task_id == taskId) \
+        .all()
+
+def loadTaskFingerprint(taskId):
+    """Load the change fingerprint of the annotations of a task in one query
+    Saving annotations in CVAT moves the updated date of the task and the max shape id of its jobs,
+    editing its frame properties moves the aggregates of its key frames.
+    :param taskId: the id of the task
+    :return: string fingerprint, or None if the task has no job
+    """
+    Task = models.Task
+    Segment = models.Segment
+    Job = models.Job
+    Taskframespec = models.Taskframespec
+    Keyframespec = models.Keyframespec
+
+    maxShapeId = app.db.session.query(func.max(Job.max_shape_id)) \
+        .join(Segment, Segment.id == Job.segment_id) \
+        .filter(Segment.task_id == Task.id) \
+        .correlate(Task) \
+        .as_scalar()
+
+    row = app.db.session.query(Task.updated_date,
+                               maxShapeId.label('max_shape_id'),
+                               func.count(Keyframespec.id).label('keyframes'),
+                               func.max(Keyframespec.id).label('max_keyframe_id'),
+                               func.sum(Keyframespec.frame).label('keyframes_frames'),
+                               func.sum(Taskframespec.propVal_id).label('keyframes_values')) \
+        .outerjoin(Taskframespec, Taskframespec.task_id == Task.id) \
+        .outerjoin(Keyframespec, Keyframespec.frameSpec_id == Taskframespec.id) \
+        .filter(Task.id == taskId) \
+        .group_by(Task.id, Task.updated_date) \
+        .first()
+
+    if row is None or row.max_shape_id is None:
+        return None
+
+    return '{}:{}:{}:{}:{}:{}'.format(row.updated_date.isoformat() if row.updated_date is not None else '', row.max_shape_id,
+                                      row.keyframes, row.max_keyframe_id, row.keyframes_frames, row.keyframes_values)
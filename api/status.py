@@ -1,6 +1,7 @@
 import models
 from flask import jsonify, send_file, make_response
 import requestsApi as rqApi
+from api.count_frames import aggregateFrames
 import traceback
 import collections
 import logging
@@ -19,15 +20,22 @@ def getStatusRequest(data):
     if missingParam != "":
         return jsonify({'message' :  missingParam + ' is missing!'}), 401
 
-    tasks = rqApi.getRequest(data, models.Task)
-    
     try :
-        tasks = rqApi.parseBytesToJson(tasks.get_data())
-        tasks = list(map(lambda task : {"project.name": task['project']['name'],
-                                        "source": task['source'],
-                                        "name": task['name'],
-                                        "status": task['status']}, tasks))
-        return jsonify(tasks)
+        Task = models.Task
+        rows, nextCursor = rqApi.queryProjection(data, Task, [models.Projects.name.label('project_name'), Task.source, Task.name, Task.status])
+        etag = rqApi.computeEtag(data, [tuple(row) for row in rows], nextCursor)
+        notModified = rqApi.notModifiedResponse(etag)
+
+        if notModified is not None:
+            return notModified
+
+        tasks = [{"project.name": projectName,
+                  "source": source,
+                  "name": name,
+                  "status": status} for taskId, projectName, source, name, status in rows]
+        return rqApi.setEtag(rqApi.pageResponse(tasks, nextCursor), etag)
+    except rqApi.QueryError as e:
+        return jsonify({'message' : str(e)}), 400
     except Exception as e:
         logger.error(e, exc_info=True)
         return jsonify({'message' : 'There is no status to show !'})
@@ -35,7 +43,8 @@ def getStatusRequest(data):
 def getTasksByStatusRequest(data):
     """Get the tasks according the status type\n
         params:
-            data: json contains status types and project name
+            data: json contains status types and project name, aggregate=true for only the total frames
+                  and the number of tasks of every status
         return: all tasks
     """
     missingParam = rqApi.checkIfParamsExist(data, ['project.name'])
@@ -44,29 +53,49 @@ def getTasksByStatusRequest(data):
         return jsonify({'message' :  missingParam + ' is missing!'}), 401
 
     if 'status' in data:
-        tasks = rqApi.getRequest({'project.name' : data['project.name'], 'status' : data['status']}, models.Task)
+        filters = {'project.name' : data['project.name'], 'status' : data['status']}
     else:
-        tasks = rqApi.getRequest({'project.name' : data['project.name']}, models.Task)
+        filters = {'project.name' : data['project.name']}
+
+    # The page of tasks (the total frames are counted on the tasks of the page)
+    for param in ['limit', 'cursor']:
+        if param in data:
+            filters[param] = data[param]
     
     try :
-        tasks = rqApi.parseBytesToJson(tasks.get_data())
+        # Only the total frames and the number of tasks of every status, counted on all the tasks by the database
+        if data.get('aggregate') == 'true':
+            counts = aggregateFrames(filters, ['status'])
+
+            return jsonify({count['status'] : {"total_frames" : count['total_frames'], "tasks" : count['tasks']} for count in counts})
+
+        Task = models.Task
+        rows, nextCursor = rqApi.queryProjection(filters, Task, [models.Projects.name.label('project_name'), Task.source, Task.name, Task.status,
+                                                                 Task.created_date, Task.updated_date, Task.size])
+        etag = rqApi.computeEtag(data, [tuple(row) for row in rows], nextCursor)
+        notModified = rqApi.notModifiedResponse(etag)
+
+        if notModified is not None:
+            return notModified
 
         # Group all tasks by status parameter
-        grouped_tasks = groupBy(tasks, 'status')
+        grouped_tasks = groupBy(rows, 'status')
 
         # Display only requested parameters in task and change to dict instead of list
-        tasks_by_status = { status  :   {   "tasks"         : list(map(lambda task : {  "project.name"  : task['project']['name'],
-                                                                                        "source"        : task['source'],
-                                                                                        "name"          : task['name'],
-                                                                                        "created_date"  : task['created_date'], 
-                                                                                        "updated_date"  : task['updated_date']}, tasks)),
+        tasks_by_status = { status  :   {   "tasks"         : [{  "project.name"  : task.project_name,
+                                                                  "source"        : task.source,
+                                                                  "name"          : task.name,
+                                                                  "created_date"  : task.created_date,
+                                                                  "updated_date"  : task.updated_date} for task in tasks],
                                             "total_frames" : countFrames(tasks)
                                         } 
                                             
                                             for status, tasks in grouped_tasks.items()
                           }
                                         
-        return jsonify(tasks_by_status)
+        return rqApi.setEtag(rqApi.pageResponse(tasks_by_status, nextCursor), etag)
+    except rqApi.QueryError as e:
+        return jsonify({'message' : str(e)}), 400
     except Exception as e:
         logger.error(e, exc_info=True)
         return jsonify({'message' : 'There is no status to show !'})
@@ -74,12 +103,12 @@ def getTasksByStatusRequest(data):
 def groupBy(array, param):
     grouped = collections.defaultdict(list)
     for element in array: 
-        grouped[element[param]].append(element)
+        grouped[getattr(element, param)].append(element)
 
     return grouped
 
 def countFrames(tasks):
     total=0
     for task in tasks:
-        total+=task["size"]
+        total+=task.size
     return total
\ No newline at end of file
@@ -1,15 +1,49 @@
 import models
-from flask import jsonify, send_file, make_response
+from flask import jsonify, send_file, make_response, json, Response, stream_with_context, current_app
 import requestsApi as rqApi
+import app
+from api.shapes import loadJobShapes, loadTaskKeyFrames, loadTaskFingerprint
+from api import interpolation, columnar, annotations_cache
+from api.multipart import quote
+from concurrent.futures import ThreadPoolExecutor
 from functools import reduce
+from itertools import chain, islice
 import traceback
+import os
 import logging
 
 logger = logging.getLogger('waitress')
 
+ANNOTATIONS_MODES = ['frames', 'keyframes']
+
+# json returns the tags as dictionaries, npz returns them as the columns of a numpy archive (see api.columnar)
+ANNOTATIONS_FORMATS = ['json', 'npz']
+
+# Number of tags serialized together in a chunk of a streamed response
+STREAM_BATCH_SIZE = 1000
+
+# Fields of the tasks used to export their tags (see findTask)
+TASK_FIELDS = 'id,name,source,size'
+
+# Maximum number of sources exported in parallel by all the requests
+ANNOTATIONS_WORKERS = int(os.environ.get('ANNOTATIONS_WORKERS', 4))
+
+# Workers shared by the requests, so the connections they take from the pool of the database
+# are bounded by ANNOTATIONS_WORKERS whatever the number of concurrent requests (threads are started on demand)
+annotations_executor = ThreadPoolExecutor(max_workers=max(ANNOTATIONS_WORKERS, 1), thread_name_prefix='annotations')
+
+# GeoJSON geometry of the coordinates of each point shape type (polygons have a single ring)
+GEOMETRIES = {
+    'Polygon' : lambda coordinates : {"type" : "Polygon", "coordinates" : [coordinates]},
+    'Polyline' : lambda coordinates : {"type" : "LineString", "coordinates" : coordinates},
+    'Points' : lambda coordinates : {"type" : "MultiPoint", "coordinates" : coordinates}
+}
+
 def getTagsFromDB(data):
     """Get all tags of a tasks
-    :param data: json contains the source of the tasks(video/image name) and project name
+    :param data: json contains the source of the tasks(video/image name) and project name, and optionally
+                 mode: 'frames' (default) to get a tag for every frame of the tracks and frame properties,
+                 'keyframes' to get only their key frames and the spans of frames they cover
     :return: Json with all tags
     """
 
@@ -17,262 +51,360 @@ def getTagsFromDB(data):
 
     if missingParam != "":
         return jsonify({'message' :  missingParam + ' is missing!'}), 401
+
+    mode = data.get('mode', 'frames')
+
+    if mode not in ANNOTATIONS_MODES:
+        return jsonify({'message' :  'mode must be one of ' + ', '.join(ANNOTATIONS_MODES)}), 400
+
+    annotationsFormat = data.get('format', 'json')
+
+    if annotationsFormat not in ANNOTATIONS_FORMATS:
+        return jsonify({'message' :  'format must be one of ' + ', '.join(ANNOTATIONS_FORMATS)}), 400
     
     try :
         projectName = data['project.name']
         sources = data['source'].split(',')
-        annotations = []
+        tasks = []
 
         for source in sources:
-            taskAnnotations = getTaskAnnotations(projectName, source)
-            
-            if taskAnnotations == -1:
+            task = findTask(projectName, source)
+
+            if task is None:
                 return jsonify({'message' :  source + ' is not exists!'}), 400
 
-            annotations.append(taskAnnotations)
+            tasks.append(task)
 
-        return jsonify(annotations), 200
+        # The tags of the tasks are the same while their fingerprints don't move
+        fingerprints = [loadTaskFingerprint(task['id']) for task in tasks]
+        etag = rqApi.computeEtag(data, [(task['id'], fingerprint) for task, fingerprint in zip(tasks, fingerprints)])
+        notModified = rqApi.notModifiedResponse(etag)
+
+        if notModified is not None:
+            return notModified
+
+        if annotationsFormat == 'npz':
+            response = Response(getTasksAnnotationsNpz(tasks, mode),
+                                mimetype='application/octet-stream',
+                                headers={'Content-Disposition': 'attachment; filename="{}"'.format(quote(projectName + '_annotations.npz'))})
+        elif data.get('stream') == 'true':
+            response = Response(stream_with_context(streamTasksAnnotations(projectName, tasks, mode, fingerprints)), mimetype='application/json')
+        else:
+            response = jsonify(getTasksAnnotations(projectName, tasks, mode, fingerprints))
+
+        return rqApi.setEtag(response, etag)
     except Exception as e:
         logger.error(e, exc_info=True)
         return jsonify({'tags' : 'There is no tags'})
 
-def getTaskAnnotations(projectName, source):
-    """Get all tags of a task
+def buildTaskAnnotations(projectName, task, mode, fingerprint):
+    """Get all tags of a task, from the cache when its fingerprint didn't move
     :param projectName: project name of the task
-    :param source: source of the task
+    :param task: the task (see findTask)
+    :param mode: see getTagsFromDB
+    :param fingerprint: the current fingerprint of the task (see api.shapes.loadTaskFingerprint)
     :return: Json with all annotations of this task
     """
-    task = rqApi.parseBytesToJson(rqApi.getRequest({'project.name' : projectName, 'source' : source}, models.Task).get_data())
+    taskAnnotations = getCachedTaskAnnotations(projectName, task, mode, fingerprint)
+
+    if taskAnnotations is None:
+        taskAnnotations = iterTaskAnnotations(projectName, task, mode)
+        taskAnnotations['annotations'] = list(taskAnnotations['annotations'])
+        taskAnnotations['frameProperties'] = list(taskAnnotations['frameProperties'])
+
+        annotations_cache.setAnnotations(task['id'], mode, fingerprint, taskAnnotations)
+
+    return taskAnnotations
+
+def getCachedTaskAnnotations(projectName, task, mode, fingerprint):
+    """Get the cached tags of a task (see api.annotations_cache)
+    :param projectName: project name of the task
+    :param task: the task (see findTask)
+    :param mode: see getTagsFromDB
+    :param fingerprint: the current fingerprint of the task (see api.shapes.loadTaskFingerprint)
+    :return: the annotations of the task, or None if they are not cached
+    """
+    taskAnnotations = annotations_cache.getAnnotations(task['id'], mode, fingerprint)
+
+    if taskAnnotations is None:
+        return None
+
+    logger.info('Annotations of task {} are cached'.format(task['id']))
+
+    # The cached annotations are shared between the requests
+    taskAnnotations = dict(taskAnnotations)
+    taskAnnotations['project.name'] = projectName
+
+    return taskAnnotations
+
+def getTasksAnnotations(projectName, tasks, mode, fingerprints):
+    """Get all tags of several tasks, in parallel on the workers shared by the requests (see annotations_executor)
+    :param projectName: project name of the tasks
+    :param tasks: the tasks (see findTask)
+    :param mode: see getTagsFromDB
+    :param fingerprints: the current fingerprint of each task (see api.shapes.loadTaskFingerprint)
+    :return: list of the annotations of each task (see buildTaskAnnotations), in the order of the tasks
+    """
+    if len(tasks) == 1 or ANNOTATIONS_WORKERS <= 1:
+        return [buildTaskAnnotations(projectName, task, mode, fingerprint) for task, fingerprint in zip(tasks, fingerprints)]
+
+    flaskApp = current_app._get_current_object()
+
+    def getWorkerTaskAnnotations(taskFingerprint):
+        # Each worker uses its own session (and connection from the pool)
+        with flaskApp.app_context():
+            try:
+                return buildTaskAnnotations(projectName, taskFingerprint[0], mode, taskFingerprint[1])
+            finally:
+                app.db.session.remove()
+
+    return list(annotations_executor.map(getWorkerTaskAnnotations, zip(tasks, fingerprints)))
+
+def findTask(projectName, source):
+    """Find the task of a source
+    :param projectName: project name of the task
+    :param source: source of the task (or the task name for images task)
+    :return: the task or None if it doesn't exist
+    """
+    task = rqApi.queryRows({'project.name' : projectName, 'source' : source}, models.Task, fields=TASK_FIELDS)
 
     if len(task) == 0:
         # Checking if the source is task name for images task
-        task = rqApi.parseBytesToJson(rqApi.getRequest({'project.name' : projectName, 'name' : source}, models.Task).get_data())
+        task = rqApi.queryRows({'project.name' : projectName, 'name' : source}, models.Task, fields=TASK_FIELDS)
         if len(task) == 0:
-            return -1
+            return None
+
+    return task[0]
 
-    jobId = rqApi.getJobId(task[0]['id'])
+def iterTaskAnnotations(projectName, task, mode='frames'):
+    """Get all tags of a task without building them
+    :param projectName: project name of the task
+    :param task: the task (see findTask)
+    :param mode: see getTagsFromDB
+    :return: dictionary of the task annotations where annotations and frameProperties are iterables
+    """
+    jobId = rqApi.getJobId(task['id'])
+    shapes = loadJobShapes(jobId)
 
-    labeledBox = getLabeledBox(jobId)
-    trackedBox = getTrackedBox(jobId, int(task[0]['size']))
-    labeledPolygon = getLabeledPolygon(jobId)
-    frameProperties = getFrameProperties(task[0]['id'], int(task[0]['size']))
+    labeledBox = getLabeledBox(shapes)
+    labeledPolygon = getLabeledPolygon(shapes)
+    labeledPoints = [getLabeledPoints(shapes, shapeType) for shapeType in ['Polyline', 'Points']]
+
+    if mode == 'keyframes':
+        trackedBox = getTrackedBoxKeyFrames(shapes, int(task['size']))
+        trackedPoints = [getTrackedPointsKeyFrames(shapes, shapeType, int(task['size'])) for shapeType in GEOMETRIES]
+        frameProperties = getFramePropertiesSpans(task['id'], int(task['size']))
+    else:
+        trackedBox = getTrackedBox(shapes, int(task['size']))
+        trackedPoints = [getTrackedPoints(shapes, shapeType, int(task['size'])) for shapeType in GEOMETRIES]
+        frameProperties = getFrameProperties(task['id'], int(task['size']))
+
+    logger.info('Loaded annotations of job {}'.format(jobId))
 
     taskAnnotations = {
         'project.name': projectName,
-        'source' : task[0]['source'],
-        'annotations' : trackedBox + labeledBox + labeledPolygon,
+        'source' : task['source'],
+        'annotations' : chain(trackedBox, labeledBox, labeledPolygon, *labeledPoints, *trackedPoints),
         'frameProperties' : frameProperties,
-        'name': task[0]['name']
+        'name': task['name']
     }
 
     return taskAnnotations
 
-def initializeProperties(model, key, value):
-    """Get all properties of a tag
-    :param model: model that represents the table with properties
-    :param key: key to search by
-    :param value: value to search by key
-    :return: dictionary contains the properties
+def getTasksAnnotationsNpz(tasks, mode='frames'):
+    """Get all tags of tasks as the columns of a numpy archive, without building them
+    :param tasks: the tasks (see findTask)
+    :param mode: see getTagsFromDB, the frame properties are always exported as spans
+    :return: the bytes of the npz archive (see api.columnar)
+    """
+    dictionaries = columnar.Dictionaries()
+    tasksColumns = []
+
+    for task in tasks:
+        size = int(task['size'])
+        shapes = loadJobShapes(rqApi.getJobId(task['id']))
+
+        columns = columnar.boxColumns(task, shapes, size, mode, dictionaries)
+        columns.update(columnar.pointShapeColumns(task, shapes, size, mode, dictionaries))
+        columns.update(columnar.framePropertyColumns(task, framePropertiesSpans(task['id'], size), dictionaries))
+        tasksColumns.append(columns)
+
+    return columnar.annotationsNpz(tasksColumns, dictionaries)
+
+def streamTasksAnnotations(projectName, tasks, mode, fingerprints):
+    """Stream the tags of tasks as a json array, a chunk for every batch of tags
+    :param projectName: project name of the tasks
+    :param tasks: the tasks (see findTask)
+    :param mode: see getTagsFromDB
+    :param fingerprints: the current fingerprint of each task (see api.shapes.loadTaskFingerprint)
+    :return: generator of json chunks
     """
-    attrs = {}
-
     try:
-        vals = rqApi.parseBytesToJson(rqApi.getRequest({key: value}, model).get_data())
+        yield '['
 
-        for val in vals:
-            startIndex = val['spec']['text'].index('=') + 1
+        for i, (task, fingerprint) in enumerate(zip(tasks, fingerprints)):
+            if i > 0:
+                yield ','
 
-            try:
-                endIndex = val['spec']['text'].index(':')
-            except:
-                endIndex = len(val['spec']['text'])
-            attrs[val['spec']['text'][startIndex : endIndex]] = val['value']
+            taskAnnotations = getCachedTaskAnnotations(projectName, task, mode, fingerprint)
 
+            if taskAnnotations is None:
+                taskAnnotations = iterTaskAnnotations(projectName, task, mode)
+
+            # Keys are written in the sorted order of jsonify
+            yield '{"annotations":'
+            yield from streamJsonArray(taskAnnotations['annotations'])
+            yield ',"frameProperties":'
+            yield from streamJsonArray(taskAnnotations['frameProperties'])
+            yield ',' + json.dumps({'name' : taskAnnotations['name'],
+                                    'project.name' : taskAnnotations['project.name'],
+                                    'source' : taskAnnotations['source']}, separators=(',', ':'))[1:]
+
+        yield ']\n'
     except Exception as e:
         logger.error(e, exc_info=True)
+        raise
+
+def streamJsonArray(items):
+    """Stream items as a json array, a chunk for every batch of items
+    :param items: iterable of json serializable items
+    :return: generator of json chunks
+    """
+    items = iter(items)
+    separator = ''
+
+    yield '['
+
+    while True:
+        batch = list(islice(items, STREAM_BATCH_SIZE))
 
-    return attrs
+        if len(batch) == 0:
+            break
+
+        yield separator + json.dumps(batch, separators=(',', ':'))[1:-1]
+        separator = ','
+
+    yield ']'
 
 # Labeledbox
 
-def getLabeledBox(jobId):
+def getLabeledBox(shapes):
     """Get all labeledbox tags of a job
-    :param jobId: the id of the job
+    :param shapes: the shapes of the job (see loadJobShapes)
     :return: array with all labeledbox tags
     """
-    labels = rqApi.parseBytesToJson(rqApi.getRequest({'job.id': jobId}, models.Labeledbox).get_data())
+    attributes = shapes['labeledBoxAttributes']
     labels = list(map(lambda label : {"box": {
-                                    "xbr": float(label['xbr']),
-                                    "xtl": float(label['xtl']),
-                                    "ybr": float(label['ybr']),
-                                    "ytl": float(label['ytl'])
+                                    "xbr": float(label.xbr),
+                                    "xtl": float(label.xtl),
+                                    "ybr": float(label.ybr),
+                                    "ytl": float(label.ytl)
                                     },
-                                    "properties" : initializeProperties(models.Labeledboxattributeval, 'box_id', str(label['id'])),
-                        "frame" : int(label['frame']),
-                        "class" : label['label']['name']}, labels))
+                                    "properties" : dict(attributes.get(label.id, {})),
+                        "frame" : int(label.frame),
+                        "class" : label.label}, shapes['labeledBox']))
 
     return labels
 
 # Trackedbox
 
-def getTrackedBox(jobId, size):
+def getTrackedBox(shapes, size):
     """Get all interpolation tags of a job
-    :param jobId: the id of the job
+    :param shapes: the shapes of the job (see loadJobShapes)
     :param size: the size of the job
-    :return: array with all tags
+    :return: iterable of all tags
     """
-    # Get all track id's of this job
-    objectsPath = rqApi.parseBytesToJson(rqApi.getRequest({'job.id': jobId}, models.Objectpath).get_data())
-
-    if len(objectsPath) != 0:
-        objectsPath = list(map(lambda x : str(x['id']), objectsPath))
-        objectsPath = ','.join(objectsPath)
-
-        # Get all tracks for this job
-        tracks = rqApi.parseBytesToJson(rqApi.getRequest({'track.id': str(objectsPath)}, models.Trackedbox).get_data())
-        tracks = list(map(lambda track : {"box":{
-                                                "xbr": float(track['xbr']),
-                                                "xtl": float(track['xtl']),
-                                                "ybr": float(track['ybr']),
-                                                "ytl": float(track['ytl'])
-                                                },
-                                                "properties" : initializeProperties(models.Trackedboxattributeval, 'box_id', str(track['id'])),
-                                            "frame" : int(track['frame']),
-                                            "class" : track['track']['label']['name'],
-                                            "track_id": int(track['track']['id']),
-                                            "outside": track['outside']}, tracks))
-
-        tracks_dict = {}
-
-        for track in tracks:
-            trackId = track['track_id']
-            if trackId not in tracks_dict:
-                tracks_dict[trackId] = []
-            
-            tracks_dict[trackId].append(track)
-
-        completeTracks = []
-
-        for trackId in tracks_dict:
-            currentTrack = tracks_dict[trackId]
-            currentTrack.sort(key=lambda x : x['frame'])
-            currentTrack = completeFrame(currentTrack, size)
-            completeTracks.extend(currentTrack)
-
-        return completeTracks
+    if len(shapes['trackedBox']) != 0:
+        keyFrames = interpolation.trackedBoxKeyFrames(shapes['trackedBox'], shapes['trackedBoxAttributes'])
+        interpolated = interpolation.interpolateBoxes(keyFrames, size)
+
+        return interpolation.boxesToDicts(keyFrames, interpolated)
     else:
         return []
 
-def initializeAttrsAndValsForTrackedBox(prevAttrs, currentAttrs):
-    """Initialize attributes and their values for tracked box
-    :param prevAttrs: attributes of the previous frame
-    :param currentAttrs: attributes of the current frame
-    :return: dictionary with all attributes
-    """
-
-    # Cloning attributes
-    attrs = {}
-    
-    for attr in prevAttrs:
-        attrs[attr] = prevAttrs[attr]
-
-    for attr in currentAttrs:
-        attrs[attr] = currentAttrs[attr]
-
-    return attrs
-
-def completeFrame(track, size):
-    """Complete all frames between key frames
-    :param track: all the key frame of a track
+def getTrackedBoxKeyFrames(shapes, size):
+    """Get all interpolation tags of a job as tracks of key frames
+    :param shapes: the shapes of the job (see loadJobShapes)
     :param size: the size of the job
-    :return: array with all completed frames
-    """
-    tracks = []
-
-    for i in range(len(track) - 1):
-        # Updating attributes for each tracked box
-        if i > 0:
-            track[i]['properties'] = initializeAttrsAndValsForTrackedBox(track[i - 1]['properties'], track[i]['properties'])
-        if not track[i]['outside']:
-            del track[i]['outside']
-            tracks.append(track[i])
-            margin = track[i+1]['frame'] - track[i]['frame']
-            if margin > 1:
-                averageTracks = averagePosition(track[i], track[i + 1], margin)
-                tracks.extend(averageTracks)
-    
-    lastTrackIndex = len(track) - 1
-
-    if not track[lastTrackIndex]['outside']:
-        del track[lastTrackIndex]['outside']
-        tracks.append(track[lastTrackIndex])
-
-        # Adding all interpolated boxes until the end of the video
-        if track[lastTrackIndex]['frame'] < size:
-            for frame in range(track[lastTrackIndex]['frame'] + 1, size):
-                newTrack = {
-                    "frame" : frame,
-                    "class" : track[lastTrackIndex]['class'],
-                    "track_id" : track[lastTrackIndex]['track_id'],
-                    "properties" : track[lastTrackIndex]['properties'],
-                    "box": {
-                        "xbr" : track[lastTrackIndex]['box']['xbr'],
-                        "xtl" : track[lastTrackIndex]['box']['xtl'],
-                        "ybr" : track[lastTrackIndex]['box']['ybr'],
-                        "ytl" : track[lastTrackIndex]['box']['ytl']
-                    }
-                }
-                tracks.append(newTrack)
-
-    return tracks
-
-def averagePosition(startFrame, stopFrame, margin):
-    """Complete all frames between key frames by calculating their average position
-    :param startFrame: start key frame
-    :param stopFrame: end key frame
-    :param margin: frames to complete
-    :return: array with all completed frames
+    :return: iterable of a track per object, with its key frames and the spans of frames it is visible in
     """
-    tracks = []
-    xbrDis = (stopFrame['box']['xbr'] - startFrame['box']['xbr']) / margin
-    xtlDis = (stopFrame['box']['xtl'] - startFrame['box']['xtl']) / margin
-    ybrDis = (stopFrame['box']['ybr'] - startFrame['box']['ybr']) / margin
-    ytlDis = (stopFrame['box']['ytl'] - startFrame['box']['ytl']) / margin
-
-    for i in range(margin - 1):
-        track = {
-            "frame" : startFrame["frame"] + i + 1,
-            "class" : startFrame["class"],
-            "track_id" : startFrame['track_id'],
-            "box": {
-                "xbr" : xbrDis * (i+1) + startFrame['box']['xbr'],
-                "xtl" : xtlDis * (i+1) + startFrame['box']['xtl'],
-                "ybr" : ybrDis * (i+1) + startFrame['box']['ybr'],
-                "ytl" : ytlDis * (i+1) + startFrame['box']['ytl']
-            }
-        }
-        tracks.append(track)
+    if len(shapes['trackedBox']) != 0:
+        keyFrames = interpolation.trackedBoxKeyFrames(shapes['trackedBox'], shapes['trackedBoxAttributes'])
 
-    return tracks
+        return interpolation.boxTracksToDicts(keyFrames, size)
+    else:
+        return []
 
 # Labeledpolygon
 
-def getLabeledPolygon(jobId):
+def getLabeledPolygon(shapes):
     """Get all labeled polygon tags of a job
-    :param jobId: the id of the job
+    :param shapes: the shapes of the job (see loadJobShapes)
     :return: array with all labeled polygon tags
     """
-    labels = rqApi.parseBytesToJson(rqApi.getRequest({'job.id': jobId}, models.Labeledpolygon).get_data())
+    attributes = shapes['labeledPolygonAttributes']
     labels = list(map(lambda label : {"geometry": {
                                         "type": "Polygon",
-                                        "coordinates" : parsePointToGeoJsonPolygon(label['points'])
+                                        "coordinates" : parsePointToGeoJsonPolygon(label.points)
                                     },
-                                    "properties" : initializeProperties(models.Labeledpolygonattributeval, 'polygon_id', str(label['id'])),
-                        "frame" : int(label['frame']),
-                        "class" : label['label']['name']}, labels))
+                                    "properties" : dict(attributes.get(label.id, {})),
+                        "frame" : int(label.frame),
+                        "class" : label.label}, shapes['labeledPolygon']))
+
+    return labels
+
+# Labeledpolyline and labeledpoints
+
+def getLabeledPoints(shapes, shapeType):
+    """Get all labeled polyline or points tags of a job
+    :param shapes: the shapes of the job (see loadJobShapes)
+    :param shapeType: 'Polyline' or 'Points'
+    :return: array with all labeled polyline or points tags
+    """
+    geometry = GEOMETRIES[shapeType]
+    attributes = shapes['labeled{}Attributes'.format(shapeType)]
+    labels = list(map(lambda label : {"geometry": geometry(parsePointToGeoJsonPolygon(label.points)[0]),
+                                    "properties" : dict(attributes.get(label.id, {})),
+                        "frame" : int(label.frame),
+                        "class" : label.label}, shapes['labeled' + shapeType]))
 
     return labels
 
+# Trackedpolygon, trackedpolyline and trackedpoints
+
+def getTrackedPoints(shapes, shapeType, size):
+    """Get all interpolation tags of a job for a point shape type
+    :param shapes: the shapes of the job (see loadJobShapes)
+    :param shapeType: 'Polygon', 'Polyline' or 'Points'
+    :param size: the size of the job
+    :return: iterable of all tags
+    """
+    rows = shapes['tracked' + shapeType]
+
+    if len(rows) != 0:
+        keyFrames = interpolation.trackedPointsKeyFrames(rows, shapes['tracked{}Attributes'.format(shapeType)])
+        completed = interpolation.interpolatePoints(keyFrames, size)
+
+        return interpolation.pointsToDicts(keyFrames, completed, GEOMETRIES[shapeType])
+    else:
+        return []
+
+def getTrackedPointsKeyFrames(shapes, shapeType, size):
+    """Get all interpolation tags of a job for a point shape type as tracks of key frames
+    :param shapes: the shapes of the job (see loadJobShapes)
+    :param shapeType: 'Polygon', 'Polyline' or 'Points'
+    :param size: the size of the job
+    :return: iterable of a track per object, with its key frames and the spans of frames it is visible in
+    """
+    rows = shapes['tracked' + shapeType]
+
+    if len(rows) != 0:
+        keyFrames = interpolation.trackedPointsKeyFrames(rows, shapes['tracked{}Attributes'.format(shapeType)])
+
+        return interpolation.pointTracksToDicts(keyFrames, size, GEOMETRIES[shapeType])
+    else:
+        return []
+
 def parsePointToGeoJsonPolygon(points):
     points = points.split(' ')
 
@@ -284,41 +416,51 @@ def parsePointToGeoJsonPolygon(points):
     return [coordinates]
 
 def getFrameProperties(taskId, taskSize):
+    for keyFrame, stopFrame in framePropertiesSpans(taskId, taskSize):
+        yield from completeProps(keyFrame, stopFrame)
+
+def getFramePropertiesSpans(taskId, taskSize):
+    for keyFrame, stopFrame in framePropertiesSpans(taskId, taskSize):
+        if keyFrame['frame'] < stopFrame:
+            span = keyFrame.copy()
+            del span['prop']
+            span['stop'] = stopFrame
+            yield span
+
+def framePropertiesSpans(taskId, taskSize):
+    """Get the key frames of the frame properties of a task with the frame where each of them stops
+    :param taskId: the id of the task
+    :param taskSize: the size of the task
+    :return: generator of (key frame, stop frame) tuples
+    """
     def getFrame(e):
         return e['frame']
     
     keyFrames = keyFramesProperties(taskId)
-    frameProperties = []
 
     for key in keyFrames:
         keyFrames[key].sort(key=getFrame)
 
         for i in range(0, len(keyFrames[key])):
             if i == len(keyFrames[key]) - 1:
-                frameProperties.extend(completeProps(keyFrames[key][i], taskSize))
+                yield keyFrames[key][i], taskSize
             else:
-                frameProperties.extend(completeProps(keyFrames[key][i], keyFrames[key][i + 1]['frame']))
-
-    return frameProperties
+                yield keyFrames[key][i], keyFrames[key][i + 1]['frame']
     
 
 def keyFramesProperties(taskId):
-    frameProperties = rqApi.parseBytesToJson(rqApi.getRequest({'task.id': str(taskId)}, models.Taskframespec).get_data())
     keyFrames = {}
-    for prop in frameProperties:
-        props = rqApi.parseBytesToJson(rqApi.getRequest({'frameSpec_id': str(prop['id'])}, models.Keyframespec).get_data())
-
-        for i in range(0, len(props)):
-            keyFrameSpec = {
-                "frame": props[i]['frame'],
-                props[i]['frameSpec']['propVal']['prop']: props[i]['frameSpec']['propVal']['value'],
-                "prop" : props[i]['frameSpec']['propVal']['prop']
-            }
+    for frame, prop, value in loadTaskKeyFrames(taskId):
+        keyFrameSpec = {
+            "frame": frame,
+            prop: value,
+            "prop" : prop
+        }
 
-            if props[i]['frameSpec']['propVal']['prop'] not in keyFrames.keys():
-                keyFrames[props[i]['frameSpec']['propVal']['prop']] = []
+        if prop not in keyFrames.keys():
+            keyFrames[prop] = []
 
-            keyFrames[props[i]['frameSpec']['propVal']['prop']].append(keyFrameSpec)
+        keyFrames[prop].append(keyFrameSpec)
 
     return keyFrames
 
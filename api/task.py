@@ -1,13 +1,15 @@
 import models
 from flask import jsonify
 import requestsApi as rqApi
-from sqlalchemy import func, String
+from sqlalchemy import func, text, String
 from sqlalchemy.dialects.postgresql import ARRAY
 import traceback
 import json
 import app
 import requests
+from api.multipart import MultipartStream
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import os
 import urllib3
 import logging
@@ -15,6 +17,20 @@ import logging
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# Maximum number of videos updated by a statement of PUT /update/score/tasks (see updateScores)
+SCORE_UPDATE_CHUNK = int(os.environ.get('SCORE_UPDATE_CHUNK', 1000))
+
+# Maximum number of tasks forwarded to cvat in parallel by a batch (see createTasksRequest)
+CREATE_TASK_WORKERS = int(os.environ.get('CREATE_TASK_WORKERS', 8))
+
+# Maximum number of tasks in a batch
+MAX_BATCH_TASKS = int(os.environ.get('MAX_BATCH_TASKS', 5000))
+
+# Pooled connections to cvat, shared by all the task creations
+cvat_session = requests.Session()
+cvat_session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=CREATE_TASK_WORKERS))
+cvat_session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=CREATE_TASK_WORKERS))
+
 def getOsId(path):
     """Get the id of the object storage according the two dir name in path
         params:
@@ -153,6 +169,152 @@ def validateAllParams(data):
         
     return ''
 
+class ProjectMetadata(object):
+    """Metadata of the project of new tasks, every lookup is done once for all the tasks of a request"""
+
+    def __init__(self, projectName):
+        self.name = projectName
+        self.id = models.Projects.query.filter_by(name=projectName).first().id
+        self.managers = getMangersUserId(self.id)
+        self._labels = None
+        self._frameProperties = None
+        self._assignees = {}
+        self._objectStorages = {}
+
+    def labels(self):
+        """Get the labels string of the project (see getLabelString)"""
+        if self._labels is None:
+            self._labels = getLabelString(self.id)
+
+        return self._labels
+
+    def frameProperties(self):
+        """Get the frame properties of the project (see getFrameProperties)"""
+        if self._frameProperties is None:
+            self._frameProperties = getFrameProperties(self.id)
+
+        return self._frameProperties
+
+    def isManager(self, user):
+        """Check if a user can create tasks in the project: a manager of the project or a superuser"""
+        return user.id in self.managers or user.is_superuser
+
+    def assignee(self, userName):
+        """Get the id of a user and if the user is authorized in the project
+        :return: tuple of (user id, authorized), (None, False) if the user doesn't exist
+        """
+        if userName not in self._assignees:
+            assignee_user = models.User.query.filter_by(username=userName).first()
+
+            if assignee_user != None:
+                self._assignees[userName] = (assignee_user.id, rqApi.checkifAuthorize(self.name, assignee_user.id))
+            else:
+                self._assignees[userName] = (None, False)
+
+        return self._assignees[userName]
+
+    def objectStorageId(self, path):
+        """Get the id of the object storage of a path (see getOsId)"""
+        key = '/'.join(path.split('/')[0:2])
+
+        if key not in self._objectStorages:
+            self._objectStorages[key] = getOsId(path)
+
+        return self._objectStorages[key]
+
+def prepareTask(data, project, current_user):
+    """Complete the parameters of a new task with the defaults of its project and validate them
+        params:
+            data: the parameters of the task (completed in place)
+            project: the metadata of the project (see ProjectMetadata)
+            current_user: the user that create the task
+    :return: tuple of (message, status code) if the task is not valid, else None
+    """
+    missingParam = rqApi.checkIfDataExist(data, ['data'])
+    if missingParam != "":
+        return missingParam + ' is missing!', 401
+
+    data['owner'] = current_user.id
+    data['project'] = project.id
+
+    if os.environ.get('WITH_OS') == 'True':
+        data['os_id'] = project.objectStorageId(data['data'])
+
+    if not project.isManager(current_user):
+        return 'Only managers can create task !', 403
+
+    if not 'storage' in data:
+        data['storage'] = 'share'
+
+    if not 'task_name' in data:
+        data['task_name'] = data['data'].split('/')[-1].split('.')[0]
+
+    if not 'score' in data:
+        data['score'] = 0
+
+    if not 'flip_flag' in data:
+        data['flip_flag'] = False
+
+    if not 'z_order' in data:
+        data['z_order'] = False
+
+    if not 'bug_tracker_link' in data:
+        data['bug_tracker_link'] = ""
+
+    if not 'labels' in data:
+        data['labels'] = project.labels()
+
+    if not 'frame_properties' in data:
+        data['frame_properties'] = project.frameProperties()
+
+    if not 'overlap_size' in data:
+        data['overlap_size'] = 0
+
+    if not 'compress_quality' in data:
+        data['compress_quality'] = 100
+
+    if not 'assignee' in data:
+        data['assignee'] = project.managers[0]
+    else:
+        assigneeId, authorized = project.assignee(data['assignee'])
+
+        if assigneeId != None:
+            if not authorized:
+                return 'assignee user not authorized !', 400
+            else:
+                data['assignee'] = assigneeId
+        else:
+            return 'assignee user not exists !', 400
+
+    param = validateAllParams(data)
+
+    if param != '':
+        return param + ' don\'t pass validation !', 404
+
+    return None
+
+def postTask(data, files=None):
+    """Forward a prepared task to cvat (see prepareTask) over the pooled session
+        params:
+            data: the parameters of the task
+            files: the uploaded files (FileStorage) of a task in local storage, they are streamed to cvat (see MultipartStream)
+    :return: tuple of (response text, status code) of cvat
+    """
+    url = os.environ.get('CVAT_SERVER') + "/create/task"
+
+    logger.info('Task create with params : {}'.format(data))
+
+    data = dict(data)
+    data['CVAT_API_TOKEN'] = os.environ.get('CVAT_API_TOKEN')
+
+    if data['storage'] != 'local' or not files:
+        response = cvat_session.post(url, data=data, verify=False)
+    else:
+        body = MultipartStream(data, [('data', curr_file) for curr_file in files])
+        response = cvat_session.post(url, data=body, headers={'Content-Type' : body.content_type}, verify=False)
+
+    return response.text, response.status_code
+
 def createTaskRequest(request, current_user):
     """Create Task
         params:
@@ -166,12 +328,9 @@ def createTaskRequest(request, current_user):
         data = request.form.to_dict()
         if not data:
             data = request.get_json()
+        # The uploaded files are spooled to disk by werkzeug and streamed to cvat without being read in memory
         files = request.files.getlist('data')
         logger.info(files)
-        all_files = set()
-        if files:
-            for curr_file in files:
-                all_files.add(('data', (curr_file.filename, curr_file.read())))
 
         missingParam = rqApi.checkIfDataExist(data, ['data'])
         if missingParam != "":
@@ -182,108 +341,163 @@ def createTaskRequest(request, current_user):
         if missingParam != "":
             return jsonify({'message' :  missingParam + ' is missing!'}), 401
 
-        projectName = request.args.get('project.name')
-        data['owner'] = current_user.id
-        data['project'] = models.Projects.query.filter_by(name=projectName).first().id
+        project = ProjectMetadata(request.args.get('project.name'))
+        error = prepareTask(data, project, current_user)
 
-        if os.environ.get('WITH_OS') == 'True':
-            data['os_id'] = getOsId(data['data'])
+        if error is not None:
+            message, code = error
+            return jsonify({'message' : message}), code
 
-        managers = getMangersUserId(data['project'])
+        return postTask(data, files)
 
-        if current_user.id not in managers and not current_user.is_superuser:
-            return jsonify({'message' : 'Only managers can create task !'}), 403
+    except  Exception as e:
+        logger.error(e, exc_info=True)
+        return jsonify({'message' : 'can\'t create task'}), 401
 
-        if not 'storage' in data:
-            data['storage'] = 'share'
+def createTasksRequest(request, current_user):
+    """Create a batch of tasks of a project
+    All the tasks are validated before any is forwarded to cvat, then they are forwarded in parallel
+    (at most CREATE_TASK_WORKERS at a time) over the pooled session.
+        params:
+            request: contains the json array of the parameters of every task (see createTaskRequest) and args
+            current_user: the user that create the tasks
+    :return: array of the result of every task: its index, the status code and the response of cvat (or the validation message)
+    """
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-        if not 'task_name' in data:
-            data['task_name'] = data['data'].split('/')[-1].split('.')[0]
+    missingParam = rqApi.checkIfParamsExist(request.args, ['project.name'])
 
-        if not 'score' in data:
-            data['score'] = 0
+    if missingParam != "":
+        return jsonify({'message' :  missingParam + ' is missing!'}), 401
 
-        if not 'flip_flag' in data:
-            data['flip_flag'] = False
+    tasks = request.get_json(silent=True)
 
-        if not 'z_order' in data:
-            data['z_order'] = False
+    if not isinstance(tasks, list) or not all(isinstance(data, dict) for data in tasks):
+        return jsonify({'message' : 'tasks must be a json array of tasks!'}), 400
 
-        if not 'bug_tracker_link' in data:
-            data['bug_tracker_link'] = ""
+    if len(tasks) > MAX_BATCH_TASKS:
+        return jsonify({'message' : 'a batch can create at most {} tasks!'.format(MAX_BATCH_TASKS)}), 400
 
-        if not 'labels' in data:
-            data['labels'] = getLabelString(data['project'])
+    try:
+        project = ProjectMetadata(request.args.get('project.name'))
 
-        if not 'frame_properties' in data:
-            data['frame_properties'] = getFrameProperties(data['project'])
+        if not project.isManager(current_user):
+            return jsonify({'message' : 'Only managers can create task !'}), 403
 
-        if not 'overlap_size' in data:
-            data['overlap_size'] = 0
+        results = []
 
-        if not 'compress_quality' in data:
-            data['compress_quality'] = 100
+        for i, data in enumerate(tasks):
+            # Uploaded files can't be sent in a batch
+            if data.get('storage') == 'local':
+                error = 'local storage can\'t be used in a batch !', 400
+            else:
+                try:
+                    error = prepareTask(data, project, current_user)
+                except Exception as e:
+                    logger.error(e, exc_info=True)
+                    error = 'task parameters are not valid ({}) !'.format(e), 400
+
+            if error is not None:
+                message, code = error
+                results.append({'index' : i, 'status' : code, 'message' : message})
+
+        if len(results) != 0:
+            return jsonify({'message' : 'no task was created, {} tasks don\'t pass validation !'.format(len(results)),
+                            'results' : results}), 400
+    except Exception as e:
+        logger.error(e, exc_info=True)
+        return jsonify({'message' : 'can\'t create tasks'}), 401
 
-        if not 'assignee' in data:
-            data['assignee'] = managers[0]
-        else:
-            userName = data['assignee']
-            assignee_user = models.User.query.filter_by(username=userName).first()
+    def forwardTask(indexedTask):
+        i, data = indexedTask
 
-            if assignee_user != None:
-                if not rqApi.checkifAuthorize(projectName, assignee_user.id):
-                     return jsonify({'message' : 'assignee user not authorized !'})
-                else:
-                    data['assignee'] = assignee_user.id
-            else:
-                 return jsonify({'message' : 'assignee user not exists !'})
+        try:
+            text, code = postTask(data)
+            return {'index' : i, 'status' : code, 'response' : text}
+        except Exception as e:
+            logger.error(e, exc_info=True)
+            return {'index' : i, 'status' : 502, 'message' : 'can\'t create task'}
 
-        param = validateAllParams(data)
+    with ThreadPoolExecutor(max_workers=CREATE_TASK_WORKERS) as executor:
+        results = list(executor.map(forwardTask, enumerate(tasks)))
 
-        if param != '':
-            return jsonify({'message' : param + ' don\'t pass validation !'}), 404
+    return jsonify({'message' : 'created {} of {} tasks'.format(sum(1 for result in results if result['status'] == 200), len(results)),
+                    'results' : results}), 200
 
-        url = os.environ.get('CVAT_SERVER') + "/create/task"
-        
-        logger.info('Task create with params : {}'.format(data))
+def parseScores(data):
+    """Get the new score of every posted video, the last score of a video wins
+        params:
+            data: array of {video_id, score}
+    :raise ValueError: if a video_id or a score is not a number
+    :return: dictionary of video id -> score
+    """
+    scores = {}
 
-        data['CVAT_API_TOKEN'] = os.environ.get('CVAT_API_TOKEN')
+    for video in data:
+        if 'video_id' in video and 'score' in video:
+            scores[int(video['video_id'])] = float(video['score'])
 
-        if data['storage'] != 'local':
-            response = requests.post(url, data=data, verify=False)
-        else:
-            response = requests.post(url, data=data, files=all_files, verify=False)
-        return response.text, response.status_code
+    return scores
 
-    except  Exception as e:
-        logger.error(e, exc_info=True)
-        return jsonify({'message' : 'can\'t create task'}), 401
+def updateScores(projectId, scores):
+    """Update the score of the tasks of videos in a single transaction, with a statement per chunk of videos
+    which joins the tasks of the project to the (video_id, score) values of the chunk
+        params:
+            projectId: the project id
+            scores: dictionary of video id -> score
+    :return: dictionary of video id -> number of tasks updated
+    """
+    matched = dict.fromkeys(scores, 0)
+    videos = list(scores.items())
+
+    for start in range(0, len(videos), SCORE_UPDATE_CHUNK):
+        chunk = videos[start:start + SCORE_UPDATE_CHUNK]
+        params = {'project_id' : projectId}
+
+        for i, (videoId, score) in enumerate(chunk):
+            params['video_id_{}'.format(i)] = videoId
+            params['score_{}'.format(i)] = score
+
+        values = ', '.join('(:video_id_{0}, :score_{0})'.format(i) for i in range(len(chunk)))
+        statement = text('WITH scores (video_id, score) AS (VALUES {values}) '
+                         'UPDATE {table} SET score = scores.score FROM scores '
+                         'WHERE {table}.video_id = scores.video_id AND {table}.project_id = :project_id '
+                         'RETURNING {table}.video_id'.format(values=values, table=models.Task.__tablename__))
+
+        for row in app.db.session.execute(statement, params):
+            matched[row[0]] += 1
+
+    app.db.session.commit()
+
+    return matched
 
 def putUpdateVideosScore(data, args):
     """Update all videos with the new score 
-    :return: if the update is success
+    :return: if the update is success, and the number of tasks updated for every video
     """
 
     missingParam = rqApi.checkIfParamsExist(args, ['project.name'])
 
     if missingParam != "":
         return jsonify({'message' :  missingParam + ' is missing!'}), 500
+
+    try:
+        scores = parseScores(data)
+    except (TypeError, ValueError):
+        return jsonify({'message' : 'video_id and score must be numbers!'}), 400
+
     try :
-        countUpdatedVideos = 0
-        for video in data:
-            if 'video_id' in video and 'score' in video:
-                video_id = video['video_id']
-                new_score = video['score']
-                tasks = models.Task.query
-                project = models.Projects.query.filter_by(name=args['project.name']).first()
-                tasks = tasks.filter_by(video_id=video_id, project=project)
-                if bool(tasks.first()):
-                    tasks.update({models.Task.score: new_score})
-                    countUpdatedVideos += 1
-                    app.db.session.commit()
-
-        return jsonify({'message' : 'updated successfully ' + str(countUpdatedVideos) + ' videos'}), 200
+        project = models.Projects.query.filter_by(name=args['project.name']).with_entities(models.Projects.id).first()
+
+        if project is None:
+            return jsonify({'message' : args['project.name'] + ' is not exists!'}), 400
+
+        matched = updateScores(project.id, scores)
+        countUpdatedVideos = sum(1 for count in matched.values() if count > 0)
+
+        return jsonify({'message' : 'updated successfully ' + str(countUpdatedVideos) + ' videos',
+                        'videos' : [{'video_id' : videoId, 'matched' : count} for videoId, count in matched.items()]}), 200
     except Exception as e:
+        app.db.session.rollback()
         logger.error(e, exc_info=True)
         return jsonify({'message' : 'can\'t update scores'}), 500
-
@@ -1,17 +1,141 @@
 import models
-from flask import jsonify, send_file, make_response
+from flask import jsonify, make_response, Response, stream_with_context
 import requestsApi as rqApi
 import requests
-from io import BytesIO
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 import zipfile
-from s3cvat import getFileUrl, _get_frame_path
+from s3cvat import getFileUrl, getFileContent, invalidateBucketCache, _get_frame_path
+from api.multipart import quote
 import traceback
 import urllib3
 import re
+import os
 import logging
 
 logger = logging.getLogger('waitress')
 
+# Number of images downloaded in parallel from s3
+WATERSHED_FETCH_WORKERS = int(os.environ.get('WATERSHED_FETCH_WORKERS', 8))
+
+# Download the images with the s3 client instead of presigned urls
+S3_DIRECT_FETCH = os.environ.get('S3_DIRECT_FETCH') == 'True'
+
+ZIP_COMPRESSIONS = {
+    'store': zipfile.ZIP_STORED,
+    'deflate': zipfile.ZIP_DEFLATED
+}
+
+class ZipStream(object):
+    """Write only file object that keeps the bytes written by a ZipFile until they are read.
+    It can seek back into the bytes not read yet, so the ZipFile rewrites the local header of an entry
+    with its crc and sizes once the entry is written, instead of writing a data descriptor."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        # Position of the first byte of the buffer in the zip
+        self.offset = 0
+        self.position = 0
+
+    def tell(self):
+        return self.position
+
+    def seekable(self):
+        return True
+
+    def seek(self, position, whence=0):
+        if whence == 1:
+            position += self.position
+        elif whence == 2:
+            position += self.offset + len(self.buffer)
+
+        if position < self.offset:
+            raise OSError('cannot seek into the bytes already read')
+
+        self.position = position
+        return position
+
+    def write(self, data):
+        start = self.position - self.offset
+        self.buffer[start:start + len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def read(self):
+        data = bytes(self.buffer)
+        self.offset += len(self.buffer)
+        del self.buffer[:]
+        return data
+
+def streamImagesZip(images, compression=zipfile.ZIP_STORED):
+    """Stream a zip of images, an entry is sent as soon as its image is available
+        params:
+            images: iterable of (file name, content) tuples
+            compression: compression of the entries (ZIP_STORED or ZIP_DEFLATED)
+        return: generator of the bytes of the zip
+    """
+    stream = ZipStream()
+
+    try:
+        with zipfile.ZipFile(stream, mode='w', compression=compression) as imagesZipFile:
+            for name, content in images:
+                imagesZipFile.writestr(name, content)
+                yield stream.read()
+
+        # Central directory
+        yield stream.read()
+    except Exception as e:
+        logger.error(e, exc_info=True)
+        raise
+
+def fetchImages(paths, workers=WATERSHED_FETCH_WORKERS):
+    """Download images from s3 in parallel over a shared pool of connections
+        params:
+            paths: paths of the images in the bucket
+            workers: number of images downloaded in parallel
+        return: generator of the content of each image (None if it doesn't exist), in the order of the paths
+    """
+    session = requests.Session()
+    session.verify = False
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    def fetchImage(path):
+        if S3_DIRECT_FETCH:
+            return getFileContent(path)
+
+        image_content = session.get(getFileUrl(path))
+
+        if image_content.status_code == 404:
+            # The bucket was deleted since its existence was cached (see bucketExists)
+            if b'<Code>NoSuchBucket</Code>' in image_content.content:
+                invalidateBucketCache()
+
+            return None
+
+        return image_content.content
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # Keep a bounded number of downloads ahead of the consumer
+            pending = deque()
+
+            for path in paths:
+                pending.append(executor.submit(fetchImage, path))
+
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
+    finally:
+        session.close()
+
 def getWatershedImageRequest(data):
     
     """Get the watershed image from s3\n
@@ -25,6 +149,11 @@ def getWatershedImageRequest(data):
     if missingParam != "":
         return jsonify({'message' :  missingParam + ' is missing!'}), 401
 
+    compression = data.get('compression', 'store')
+
+    if compression not in ZIP_COMPRESSIONS:
+        return jsonify({'message' :  'compression must be one of ' + ', '.join(ZIP_COMPRESSIONS)}), 400
+
     urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
     try:
@@ -38,21 +167,16 @@ def getWatershedImageRequest(data):
         task_sources = task_sources.all()
         task_data_dir = task.get_data_dirname()
 
-        images = BytesIO()
-        with zipfile.ZipFile(images, mode='w') as imagesZipFile:
-            for task_source in task_sources:
-                frameUrl = getFileUrl(_get_frame_path(task_source.frame, task_data_dir))
-                image_content = requests.get(frameUrl, verify=False)
-
-                if image_content.status_code != 404:
-                    image_content = image_content.content
-                    insensitive_source = re.compile(re.escape('.jpg'), re.IGNORECASE)
-                    source = insensitive_source.sub('_w.png', task_source.source_name)
-                    imagesZipFile.writestr(source, image_content)
-            
-        images.seek(0)
-
-        return send_file(images, mimetype="application/zip", attachment_filename=str(len(task_sources)) + "_images_" + project.name +".zip", as_attachment=True)
+        paths = [_get_frame_path(task_source.frame, task_data_dir) for task_source in task_sources]
+        insensitive_source = re.compile(re.escape('.jpg'), re.IGNORECASE)
+        sources = [insensitive_source.sub('_w.png', task_source.source_name) for task_source in task_sources]
+
+        images = ((source, image_content) for source, image_content in zip(sources, fetchImages(paths)) if image_content is not None)
+        attachment_filename = str(len(task_sources)) + "_images_" + project.name +".zip"
+
+        return Response(stream_with_context(streamImagesZip(images, ZIP_COMPRESSIONS[compression])),
+                        mimetype="application/zip",
+                        headers={'Content-Disposition': 'attachment; filename="{}"'.format(quote(attachment_filename))})
     except Exception as e:
         logger.error(e, exc_info=True)
         return jsonify({'message' : 'Cannot get images!'})
@@ -4,6 +4,8 @@ from sqlalchemy import text
 import os
 import ptvsd
 from requestsApi import *
+from planner import QueryError
+import planner
 from api.tags import getTagsFromDB
 from api.login import loginRequest
 from api.status import getStatusRequest, getTasksByStatusRequest
@@ -11,8 +13,11 @@ from api.watershed_images import getWatershedImageRequest
 from api.count_frames import getCountFinishFramesRequest
 from api.tags import getTagsFromDB
 from api.task import putUpdateVideosScore
-from api.task import createTaskRequest
+from api.task import createTaskRequest, createTasksRequest
+from api import annotations_cache
+from api.shapes import checkShapeTables
 from models import *
+from encoder import ResponseEncoder
 from functools import wraps
 import jwt
 import logging
@@ -28,6 +33,9 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 
 app.config['SECRET_KEY'] = 'CVAT-API'
 
+# Response encoder of jsonify (orjson when it is installed)
+app.json_encoder = ResponseEncoder
+
 # Database
 app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql+psycopg2://' + os.environ.get('DB_USER') + ':' + os.environ.get('DB_PASSWORD') + '@' + os.environ.get('DB_HOST_IP') + ':5432/' + os.environ.get('DB_NAME')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
@@ -55,7 +63,7 @@ def token_required(f):
 
             try:
                 data = jwt.decode(token, app.config['SECRET_KEY'])
-                current_user = User.query.filter_by(id=data['id']).first()
+                current_user = getUser(data['id'])
             except:
                 return jsonify({'message' : 'Token is invalid!'}), 401
 
@@ -81,7 +89,7 @@ def auth_required(f):
                 return jsonify({'message' : 'Project name is missing!'}), 401
 
             current_user = args[0]
-            if not checkifAuthorize(pname, current_user.id) :
+            if not isAuthorized(pname, current_user.id) :
                 return jsonify({'message' : 'You are not authorized !'})
             
         return f(*args, **kwargs)
@@ -111,7 +119,10 @@ def get(current_user, modelName):
 
     data = request.args
 
-    model = eval(modelName.capitalize())
+    try:
+        model = planner.getModel(modelName)
+    except QueryError as e:
+        return jsonify({'message' : str(e)}), 404
 
     response = getRequest(data, model)
 
@@ -187,6 +198,49 @@ def createTask(current_user):
 
     return response
 
+@app.route('/task/create/batch', methods=['POST'])
+@token_required
+@auth_required
+def createTasks(current_user):
+    response = createTasksRequest(request, current_user)
+
+    return response
+
+@app.route('/cache/stats', methods=['GET'])
+@token_required
+def getCacheStats(current_user):
+    if current_user is not None and not current_user.is_superuser:
+        return jsonify({'message' : 'Only superusers can see the caches !'}), 403
+
+    return jsonify({'authorization' : authorization_cache.stats,
+                    'user' : user_cache.stats,
+                    'annotations' : annotations_cache.annotations_cache.stats})
+
+@app.route('/cache/invalidate', methods=['POST'])
+@token_required
+def invalidateCache(current_user):
+    """
+    Invalidate the authorization caches of a user (user_id), of a project (project.name) or all of them.
+    annotations=true also removes all the annotations from the memory cache.
+    """
+    if current_user is not None and not current_user.is_superuser:
+        return jsonify({'message' : 'Only superusers can invalidate the caches !'}), 403
+
+    data = request.get_json()
+    if not data:
+        data = request.form.to_dict()
+
+    if 'user_id' in data:
+        invalidateUser(int(data['user_id']))
+    if 'project.name' in data:
+        invalidateProject(data['project.name'])
+    if 'user_id' not in data and 'project.name' not in data:
+        invalidateAuthCaches()
+    if str(data.get('annotations')).lower() == 'true':
+        annotations_cache.annotations_cache.clear()
+
+    return jsonify({'message' : 'caches invalidated'})
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     response = loginRequest(request.authorization)
@@ -194,4 +248,9 @@ def login():
     return response
     
 if __name__ == '__main__':
+    planner.buildRegistry()
+
+    with app.app_context():
+        checkShapeTables()
+
     serve(app, host="0.0.0.0", port=5000)
\ No newline at end of file
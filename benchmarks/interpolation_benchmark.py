@@ -0,0 +1,224 @@
+"""Benchmark of the tracked box interpolation of /task/annotations
+
+Compares the previous per-frame dictionary implementation (completeFrame / averagePosition)
+with the NumPy engine in api/interpolation.py, and checks that both produce the same boxes.
+
+It reports the timings of the engine alone and of the end to end path (engine and dictionaries of the response):
+building the dictionaries dominates the end to end time, so the end to end gain is much smaller than the engine gain.
+
+Usage: python benchmarks/interpolation_benchmark.py [tracks] [keyframes per track] [video size] [repeat]
+"""
+import os
+import sys
+import gc
+import random
+import time
+from collections import namedtuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from api import interpolation
+
+TrackedBoxRow = namedtuple('TrackedBoxRow', ['id', 'frame', 'outside', 'xtl', 'ytl', 'xbr', 'ybr', 'track_id', 'label'])
+
+# Previous implementation (api/tags.py)
+
+def legacyTrackedBox(rows, attributes, size):
+    tracks = list(map(lambda track : {"box":{
+                                            "xbr": float(track.xbr),
+                                            "xtl": float(track.xtl),
+                                            "ybr": float(track.ybr),
+                                            "ytl": float(track.ytl)
+                                            },
+                                            "properties" : dict(attributes.get(track.id, {})),
+                                        "frame" : int(track.frame),
+                                        "class" : track.label,
+                                        "track_id": int(track.track_id),
+                                        "outside": track.outside}, rows))
+
+    tracks_dict = {}
+
+    for track in tracks:
+        trackId = track['track_id']
+        if trackId not in tracks_dict:
+            tracks_dict[trackId] = []
+        
+        tracks_dict[trackId].append(track)
+
+    completeTracks = []
+
+    for trackId in tracks_dict:
+        currentTrack = tracks_dict[trackId]
+        currentTrack.sort(key=lambda x : x['frame'])
+        currentTrack = completeFrame(currentTrack, size)
+        completeTracks.extend(currentTrack)
+
+    return completeTracks
+
+def initializeAttrsAndValsForTrackedBox(prevAttrs, currentAttrs):
+    """Initialize attributes and their values for tracked box
+    :param prevAttrs: attributes of the previous frame
+    :param currentAttrs: attributes of the current frame
+    :return: dictionary with all attributes
+    """
+
+    # Cloning attributes
+    attrs = {}
+    
+    for attr in prevAttrs:
+        attrs[attr] = prevAttrs[attr]
+
+    for attr in currentAttrs:
+        attrs[attr] = currentAttrs[attr]
+
+    return attrs
+
+def completeFrame(track, size):
+    """Complete all frames between key frames
+    :param track: all the key frame of a track
+    :param size: the size of the job
+    :return: array with all completed frames
+    """
+    tracks = []
+
+    for i in range(len(track) - 1):
+        # Updating attributes for each tracked box
+        if i > 0:
+            track[i]['properties'] = initializeAttrsAndValsForTrackedBox(track[i - 1]['properties'], track[i]['properties'])
+        if not track[i]['outside']:
+            del track[i]['outside']
+            tracks.append(track[i])
+            margin = track[i+1]['frame'] - track[i]['frame']
+            if margin > 1:
+                averageTracks = averagePosition(track[i], track[i + 1], margin)
+                tracks.extend(averageTracks)
+    
+    lastTrackIndex = len(track) - 1
+
+    if not track[lastTrackIndex]['outside']:
+        del track[lastTrackIndex]['outside']
+        tracks.append(track[lastTrackIndex])
+
+        # Adding all interpolated boxes until the end of the video
+        if track[lastTrackIndex]['frame'] < size:
+            for frame in range(track[lastTrackIndex]['frame'] + 1, size):
+                newTrack = {
+                    "frame" : frame,
+                    "class" : track[lastTrackIndex]['class'],
+                    "track_id" : track[lastTrackIndex]['track_id'],
+                    "properties" : track[lastTrackIndex]['properties'],
+                    "box": {
+                        "xbr" : track[lastTrackIndex]['box']['xbr'],
+                        "xtl" : track[lastTrackIndex]['box']['xtl'],
+                        "ybr" : track[lastTrackIndex]['box']['ybr'],
+                        "ytl" : track[lastTrackIndex]['box']['ytl']
+                    }
+                }
+                tracks.append(newTrack)
+
+    return tracks
+
+def averagePosition(startFrame, stopFrame, margin):
+    """Complete all frames between key frames by calculating their average position
+    :param startFrame: start key frame
+    :param stopFrame: end key frame
+    :param margin: frames to complete
+    :return: array with all completed frames
+    """
+    tracks = []
+    xbrDis = (stopFrame['box']['xbr'] - startFrame['box']['xbr']) / margin
+    xtlDis = (stopFrame['box']['xtl'] - startFrame['box']['xtl']) / margin
+    ybrDis = (stopFrame['box']['ybr'] - startFrame['box']['ybr']) / margin
+    ytlDis = (stopFrame['box']['ytl'] - startFrame['box']['ytl']) / margin
+
+    for i in range(margin - 1):
+        track = {
+            "frame" : startFrame["frame"] + i + 1,
+            "class" : startFrame["class"],
+            "track_id" : startFrame['track_id'],
+            "box": {
+                "xbr" : xbrDis * (i+1) + startFrame['box']['xbr'],
+                "xtl" : xtlDis * (i+1) + startFrame['box']['xtl'],
+                "ybr" : ybrDis * (i+1) + startFrame['box']['ybr'],
+                "ytl" : ytlDis * (i+1) + startFrame['box']['ytl']
+            }
+        }
+        tracks.append(track)
+
+    return tracks
+
+# Benchmark
+
+def generateRows(tracksCount, keyFramesCount, size):
+    rows = []
+    attributes = {}
+    boxId = 0
+
+    for trackId in range(tracksCount):
+        frames = sorted(random.sample(range(size), keyFramesCount))
+
+        for frame in frames:
+            xtl = random.uniform(0, 1000)
+            ytl = random.uniform(0, 1000)
+            rows.append(TrackedBoxRow(boxId, frame, random.random() < 0.2,
+                                      xtl, ytl, xtl + random.uniform(1, 200), ytl + random.uniform(1, 200),
+                                      trackId, 'label' + str(trackId % 5)))
+            attributes[boxId] = {'attr' + str(boxId % 3): str(boxId)}
+            boxId += 1
+
+    return rows, attributes
+
+def numpyTrackedBox(rows, attributes, size):
+    keyFrames = interpolation.trackedBoxKeyFrames(rows, attributes)
+    interpolated = interpolation.interpolateBoxes(keyFrames, size)
+
+    return keyFrames, interpolated
+
+def numpyTrackedBoxDicts(rows, attributes, size):
+    """The end to end path of /task/annotations: the NumPy engine and the dictionaries of the response"""
+    return list(interpolation.boxesToDicts(*numpyTrackedBox(rows, attributes, size)))
+
+def measure(func, repeat, *args):
+    """Get the best time of func on args, each run starts from a collected heap and its result is dropped
+    so the runs don't pay for the garbage collection of each other's objects"""
+    best = None
+
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+def main():
+    tracksCount = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    keyFramesCount = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    size = int(sys.argv[3]) if len(sys.argv) > 3 else 10000
+    repeat = int(sys.argv[4]) if len(sys.argv) > 4 else 3
+
+    random.seed(0)
+    rows, attributes = generateRows(tracksCount, keyFramesCount, size)
+
+    legacy = legacyTrackedBox(rows, attributes, size)
+    dicts = numpyTrackedBoxDicts(rows, attributes, size)
+
+    assert len(legacy) == len(dicts), 'different number of boxes'
+    assert legacy == dicts, 'different boxes'
+
+    boxes = len(dicts)
+    del legacy, dicts
+
+    legacyTime = measure(legacyTrackedBox, repeat, rows, attributes, size)
+    numpyTime = measure(numpyTrackedBox, repeat, rows, attributes, size)
+    endToEndTime = measure(numpyTrackedBoxDicts, repeat, rows, attributes, size)
+
+    print('{} tracks, {} key frames per track, {} frames -> {} boxes'.format(tracksCount, keyFramesCount, size, boxes))
+    print('completeFrame (dicts)        : {:.3f}s'.format(legacyTime))
+    print('interpolateBoxes (arrays)    : {:.3f}s'.format(numpyTime))
+    print('interpolateBoxes + dicts     : {:.3f}s'.format(endToEndTime))
+    print('speedup engine / end to end  : {:.1f}x / {:.2f}x'.format(legacyTime / numpyTime, legacyTime / endToEndTime))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Benchmark of the serialization of the rows of /model/<modelName>
+
+Compares the previous reflective Serializeable.serialized loop with the compiled serializers of
+serializers.py on Task and Trackedbox rows (with all their relationships), and checks that both
+produce the same json. The compiled serializers also encode the datetimes, which the legacy
+rows left to the json encoder of the response.
+
+Usage: python benchmarks/serializer_benchmark.py [rows] [repeat]
+"""
+import os
+import sys
+import datetime
+import json
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# The models are not bound to a database in the benchmark
+for name in ['DB_USER', 'DB_PASSWORD', 'DB_HOST_IP', 'DB_NAME']:
+    os.environ.setdefault(name, 'benchmark')
+
+import models
+import serializers
+from models import db
+
+# Previous implementation (models.py)
+
+def legacySerialized(self):
+    blacklist = ['_sa_instance_state']
+    blacklist.extend(getattr(self, '_serialize_blacklist', []))
+    result = {}
+    for k in self.__public__:
+        v = getattr(self, k)
+        if k in blacklist:
+            continue
+        elif isinstance(v, list):
+            result[k] = [legacySerialized(i) for i in v]
+        elif isinstance(v, db.Model):
+            result[k] = legacySerialized(v)
+        else:
+            result[k] = v
+
+    return result
+
+def generateRows(count):
+    """Generate Task and Trackedbox rows which share their relationships like the rows of a query"""
+    owner = models.User(id=1, username='owner', is_superuser=True, date_joined=datetime.datetime(2020, 1, 1))
+    assignee = models.User(id=2, username='assignee', is_superuser=False, last_login=datetime.datetime(2020, 2, 1))
+    project = models.Projects(id=1, name='project', has_score=True)
+
+    tasks = []
+    for i in range(count):
+        tasks.append(models.Task(id=i, name='task{0}'.format(i), size=1000, path='/data/{0}'.format(i), mode='interpolation',
+                                 owner=owner, assignee=assignee, bug_tracker='', overlap=0, z_order=False, flipped=False,
+                                 source='video{0}.mp4'.format(i), status='annotation', project=project, score=0.0,
+                                 last_viewed_frame=0, video_id=i,
+                                 created_date=datetime.datetime(2020, 1, 1, 10), updated_date=datetime.datetime(2020, 1, 2, 10)))
+
+    segment = models.Segment(id=1, task=tasks[0], start_frame=0, stop_frame=999)
+    job = models.Job(id=1, segment=segment, assignee=assignee, status='annotation', max_shape_id=count)
+    label = models.Label(id=1, task=tasks[0], name='car')
+    track = models.Objectpath(id=1, frame=0, group_id=0, client_id=1, label=label, job=job, shapes='boxes')
+
+    boxes = []
+    for i in range(count):
+        boxes.append(models.Trackedbox(id=i, occluded=False, z_order=0, track=track, frame=i, outside=False,
+                                       xtl=float(i), ytl=float(i), xbr=i + 50.0, ybr=i + 60.0))
+
+    return tasks, boxes
+
+def measure(serialize, rows, repeat):
+    """Get the best rows per second of serialize on rows"""
+    best = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for row in rows:
+            serialize(row)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return len(rows) / best
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    tasks, boxes = generateRows(count)
+
+    for name, model, rows in [('Task', models.Task, tasks), ('Trackedbox', models.Trackedbox, boxes)]:
+        compiled = serializers.getSerializer(model)
+
+        # The json responses are the same (datetimes are serialized as flask does)
+        for row in rows[:100]:
+            assert json.dumps(legacySerialized(row), default=serializers.serializeDate, sort_keys=True) == \
+                   json.dumps(compiled(row), sort_keys=True)
+
+        legacyRate = measure(legacySerialized, rows, repeat)
+        compiledRate = measure(compiled, rows, repeat)
+
+        print('{0}: legacy {1:,.0f} rows/s, compiled {2:,.0f} rows/s ({3:.1f}x)'.format(name, legacyRate, compiledRate,
+                                                                                         compiledRate / legacyRate))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import OrderedDict
+
+class TTLCache(object):
+    """Thread safe LRU cache whose entries expire ttl seconds after they were set.\n
+    The cache keeps at most maxsize entries, and at most maxweight total weight when it is set.\n
+    Example : cache = TTLCache(maxsize=1024, ttl=60)"""
+
+    def __init__(self, maxsize=1024, ttl=60, maxweight=None):
+        self.maxsize = maxsize
+        self.maxweight = maxweight
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.weight = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the value of key, or default if it is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None or entry[1] <= time.time():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, weight=1):
+        """Set the value of key, evicting the least recently used entries above maxsize (or maxweight)"""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            # A value heavier than the whole cache is not kept
+            if self.maxweight is not None and weight > self.maxweight:
+                return
+
+            self._entries[key] = (value, time.time() + self.ttl, weight)
+            self.weight += weight
+
+            while len(self._entries) > self.maxsize or (self.maxweight is not None and self.weight > self.maxweight):
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        """Remove an entry, the lock must be held"""
+        self.weight -= self._entries.pop(key)[2]
+
+    def invalidate(self, key):
+        """Remove key from the cache"""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def invalidateWhere(self, predicate):
+        """Remove all the keys for which predicate(key) is true"""
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                self._remove(key)
+
+    def clear(self):
+        """Remove all the keys from the cache"""
+        with self._lock:
+            self._entries.clear()
+            self.weight = 0
+
+    @property
+    def stats(self):
+        with self._lock:
+            return {'hits' : self.hits,
+                    'misses' : self.misses,
+                    'size' : len(self._entries),
+                    'maxsize' : self.maxsize,
+                    'weight' : self.weight,
+                    'maxweight' : self.maxweight,
+                    'ttl' : self.ttl}
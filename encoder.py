@@ -0,0 +1,40 @@
+import decimal
+from flask import request, has_request_context
+from flask.json import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def isCompact():
+    """Check if the client asked for compact json (compact=true): keys are not sorted and nothing is indented"""
+    return has_request_context() and request.args.get('compact') == 'true'
+
+class ResponseEncoder(JSONEncoder):
+    """JSON encoder of the responses (app.json_encoder), used by jsonify and flask.json.dumps.\n
+    It encodes with orjson when it is installed and with the standard library json otherwise,
+    datetimes are encoded as http dates like flask does and decimals as numbers."""
+
+    def default(self, o):
+        if isinstance(o, decimal.Decimal):
+            return float(o)
+
+        return JSONEncoder.default(self, o)
+
+    def encode(self, o):
+        if isCompact():
+            self.sort_keys = False
+            self.indent = None
+            self.item_separator, self.key_separator = ',', ':'
+
+        # Indented json (debug mode) is left to the standard library
+        if orjson is None or self.indent is not None:
+            return JSONEncoder.encode(self, o)
+
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+
+        return orjson.dumps(o, default=self.default, option=option).decode()
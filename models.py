@@ -3,25 +3,21 @@ from sqlalchemy.ext.declarative import as_declarative
 from sqlalchemy.ext.declarative import declared_attr
 import json
 import os
+import serializers
 
 class Serializeable(object):
     @property
     def serialized(self) :
-        blacklist = ['_sa_instance_state']
-        blacklist.extend(getattr(self, '_serialize_blacklist', []))
-        result = {}
-        for k in self.__public__:
-            v = getattr(self, k)
-            if k in blacklist:
-                continue
-            elif isinstance(v, list):
-                result[k] = [i.serialized for i in v]
-            elif isinstance(v, db.Model):
-                result[k] = v.serialized
-            else:
-                result[k] = v
-
-        return result
+        return self.serialize()
+
+    def serialize(self, fields=None, depth=None):
+        """Serialize the public keys of the row with the compiled serializer of its model (see serializers)
+        :param fields: tree of the fields to serialize (see planner.getFields), None for all the public keys
+        :param depth: maximum number of relationships to follow, None for no limit
+        :return: dictionary of the serialized row
+        """
+        return serializers.getSerializer(type(self), fields, depth)(self)
+
     def toJson(self):
         return json.dumps(self.serialized)
     def _asdict(self):
@@ -673,7 +669,7 @@ class Trackedpoints(Serializeable, Trackedobject, Polyshape):
     }
 
 class Trackedpointsattributeval(Serializeable, Attributeval):
-    __tablename__ = 'engine_trackedoointsattributeval'
+    __tablename__ = 'engine_trackedpointsattributeval'
     __public__ = ['id',
                     'spec' ,
                     'value',
@@ -0,0 +1,197 @@
+import models
+from sqlalchemy import inspect
+from sqlalchemy.orm import configure_mappers, selectinload
+from cache import TTLCache
+import serializers
+import threading
+
+# Maximum number of relationships in a filter path (for example: track.job.segment.task.id has 4)
+MAX_PATH_DEPTH = 5
+
+# Request parameters which are not filters (see requestsApi.queryPage, encoder.isCompact and api.count_frames)
+RESERVED_PARAMS = ['limit', 'cursor', 'fields', 'depth', 'compact', 'group_by', 'date_column']
+
+# Compiled join plans by model and filter keys
+plan_cache = TTLCache(maxsize=1024, ttl=24 * 60 * 60)
+
+registry = {}
+registry_lock = threading.Lock()
+
+class QueryError(Exception):
+    """A query on an unknown model or filter path"""
+    pass
+
+def isFilterColumn(model, column):
+    """Check if a column can be used as a filter: public columns and foreign keys
+    (private columns such as passwords and secret keys can't be filtered)"""
+    return column.key in getattr(model, '__public__', []) or any(c.foreign_keys for c in column.columns)
+
+def modelPaths(model):
+    """Get all the filter paths of a model
+    :param model: the model class
+    :return: dictionary of dotted path -> (list of (relationship, related model) joins, column)
+    """
+    paths = {}
+
+    def visit(currModel, prefix, joins, visited):
+        mapper = inspect(currModel)
+
+        for column in mapper.column_attrs:
+            if isFilterColumn(currModel, column):
+                paths[prefix + column.key] = (joins, getattr(currModel, column.key))
+
+        if len(joins) < MAX_PATH_DEPTH:
+            for relationship in mapper.relationships:
+                relation_model = relationship.mapper.class_
+
+                if relation_model not in visited:
+                    visit(relation_model,
+                          prefix + relationship.key + '.',
+                          joins + [(getattr(currModel, relationship.key), relation_model)],
+                          visited | {relation_model})
+
+    visit(model, '', [], {model})
+
+    return paths
+
+def buildRegistry():
+    """Register all the serializable models and their filter paths"""
+    with registry_lock:
+        if registry:
+            return registry
+
+        configure_mappers()
+
+        for model in models.Serializeable.__subclasses__():
+            registry[model.__name__] = modelPaths(model)
+
+        serializers.compileAll(models.Serializeable.__subclasses__())
+
+    return registry
+
+def getModel(modelName):
+    """Get a registered model by its name (case insensitive)
+    :param modelName: name of the model, for example: task or projects_users
+    :return: the model class
+    """
+    name = modelName.capitalize()
+
+    if name not in buildRegistry():
+        raise QueryError(modelName + ' is not a model!')
+
+    return getattr(models, name)
+
+def getPlan(model, keys):
+    """Get the compiled plan of a query on a model filtered by keys
+    :param model: the model class
+    :param keys: the filter keys (dotted paths), reserved parameters are ignored
+    :return: tuple of (list of (relationship, related model) joins, list of (key, column) filters)
+    """
+    cacheKey = (model.__name__, tuple(sorted(key for key in keys if key not in RESERVED_PARAMS)))
+    plan = plan_cache.get(cacheKey)
+
+    if plan is None:
+        paths = buildRegistry().get(model.__name__)
+
+        if paths is None:
+            raise QueryError(model.__name__ + ' is not a model!')
+
+        # Each relationship path is joined only once
+        joins = []
+        joined = set()
+        filters = []
+
+        for key in cacheKey[1]:
+            if key not in paths:
+                raise QueryError(key + ' is not a filter of ' + model.__name__.lower() + '!')
+
+            keyJoins, column = paths[key]
+            path = ()
+
+            for relation, relation_model in keyJoins:
+                path += (relation.key,)
+
+                if path not in joined:
+                    joined.add(path)
+                    joins.append((relation, relation_model))
+
+            filters.append((key, column))
+
+        plan = (joins, filters)
+        plan_cache.set(cacheKey, plan)
+
+    return plan
+
+def getFields(model, fields):
+    """Get the tree of the fields to serialize from the fields parameter
+    :param model: the model class
+    :param fields: comma separated public keys (dotted paths through relationships), for example: id,frame,job.id
+    :return: dictionary of public key -> tree of the relationship fields (None for all the fields),
+             or None for all the fields of the model
+    """
+    if fields is None:
+        return None
+
+    cacheKey = ('fields', model.__name__, fields)
+    tree = plan_cache.get(cacheKey)
+
+    if tree is None:
+        tree = {}
+
+        for field in fields.split(','):
+            currModel = model
+            node = tree
+            keys = field.split('.')
+
+            for i, key in enumerate(keys):
+                if key not in getattr(currModel, '__public__', []):
+                    raise QueryError(field + ' is not a field of ' + model.__name__.lower() + '!')
+
+                relationships = inspect(currModel).relationships
+
+                if i == len(keys) - 1:
+                    # The whole key is requested
+                    node[key] = None
+                    break
+
+                if key not in relationships:
+                    raise QueryError(field + ' is not a field of ' + model.__name__.lower() + '!')
+
+                if key in node and node[key] is None:
+                    break
+
+                node = node.setdefault(key, {})
+                currModel = relationships[key].mapper.class_
+
+        plan_cache.set(cacheKey, tree)
+
+    return tree
+
+def eagerLoads(model, fields=None, depth=None, loader=None):
+    """Get the loader options which load the serialized relationships of a model in bulk (one select per relationship)
+    :param model: the model class
+    :param fields: tree of the fields to serialize (see getFields)
+    :param depth: maximum number of relationships to follow, None for no limit
+    :param loader: loader of the relationship of model (for nested relationships)
+    :return: list of loader options
+    """
+    options = []
+
+    if depth is not None and depth <= 0:
+        return options
+
+    relationships = inspect(model).relationships
+
+    for key in getattr(model, '__public__', []):
+        if key in relationships and (fields is None or key in fields):
+            relation = getattr(model, key)
+            relationLoader = selectinload(relation) if loader is None else loader.selectinload(relation)
+            nested = eagerLoads(relationships[key].mapper.class_,
+                                None if fields is None else fields[key],
+                                None if depth is None else depth - 1,
+                                relationLoader)
+
+            # Nested loaders also load their parents
+            options.extend(nested if nested else [relationLoader])
+
+    return options
@@ -1,36 +1,203 @@
 from models import *
-from sqlalchemy import text
-from flask import jsonify, send_file, make_response
-from itertools import tee
+from sqlalchemy import text, inspect
+from flask import jsonify, send_file, make_response, request
+from werkzeug.datastructures import MultiDict
 from s3cvat import _get_frame_path
+from cache import TTLCache
+from planner import QueryError
+from collections import namedtuple
+import planner
+import serializers
+import base64
+import hashlib
+import os
 
-def pairwise(iterable):
-    a, b = tee(iterable)
-    next(b, None)
-    return zip(a ,b)
+# Maximum number of rows in a page
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', 10000))
 
-def getRequest(filters, model):
-    """Return any model and filters.\n
-    Example : getRequest({"project.name" : "ProjectName"}, Model)"""
+# Cache of the positive authorization decisions by (user id, project names), a refusal is checked again on the next request
+authorization_cache = TTLCache(maxsize=int(os.environ.get('AUTH_CACHE_SIZE', 1024)), ttl=int(os.environ.get('AUTH_CACHE_TTL', 60)))
+
+# Fields of a user kept by user_cache, plain data shared by the threads instead of a model instance
+CachedUser = namedtuple('CachedUser', ['id', 'username', 'is_superuser'])
+
+# Cache of the users by id (see CachedUser)
+user_cache = TTLCache(maxsize=int(os.environ.get('AUTH_CACHE_SIZE', 1024)), ttl=int(os.environ.get('AUTH_CACHE_TTL', 60)))
+
+def buildQuery(filters, model):
+    """Return the query of any model and filters.\n
+    Raise QueryError if a filter is not a path of the model (see planner).\n
+    Example : buildQuery({"project.name" : "ProjectName"}, Model)"""
+
+    joins, columns = planner.getPlan(model, list(filters))
 
     result = model.query
-    for key in filters:
-        values = filters[key].split(',')
-        if len(values) != 0 :
-            if '.' not in key:
-                result = result.filter(getattr(model, key).in_(values))
-            else:
-                key_splited = key.split('.')
-                currModel = model
-                for attr1, attr2 in pairwise(key_splited):  
-                    relation = getattr(currModel, attr1)
-                    relation_model = relation.mapper.class_
-                    field = getattr(relation_model, attr2)
-                    result = result.join(relation_model, relation)
-                    currModel = relation_model
-                result = result.filter(field.in_(values))
-    results = [i.serialized for i in result.all()]
-    return jsonify(results)
+    for relation, relation_model in joins:
+        result = result.join(relation_model, relation)
+    for key, column in columns:
+        result = result.filter(column.in_(filters[key].split(',')))
+    return result
+
+def serializeQuery(query, filters, model, fields=None, depth=None):
+    """Return the query loading the serialized relationships in bulk and the serializer of its rows.\n
+    fields and depth default to the fields and depth parameters of the filters (see planner.getFields)."""
+
+    fields = planner.getFields(model, filters.get('fields') if fields is None else fields)
+    depth = parseDepth(filters.get('depth') if depth is None else depth)
+
+    return query.options(*planner.eagerLoads(model, fields, depth)), serializers.getSerializer(model, fields, depth)
+
+def queryRows(filters, model, fields=None, depth=None):
+    """Return the serialized rows of any model and filters as python dicts.\n
+    Use it instead of getRequest when the result is not sent as is to the client.\n
+    Example : queryRows({"project.name" : "ProjectName"}, Model, fields="id,size")"""
+
+    query, serialize = serializeQuery(buildQuery(filters, model), filters, model, fields, depth)
+
+    return [serialize(i) for i in query.all()]
+
+def encodeCursor(key):
+    """Return the opaque cursor token of a primary key"""
+
+    return base64.urlsafe_b64encode(str(key).encode()).decode()
+
+def decodeCursor(cursor):
+    """Return the primary key of a cursor token.\n
+    Raise QueryError if the cursor is not a valid token."""
+
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, TypeError, UnicodeError):
+        raise QueryError('cursor is not valid!')
+
+def parseLimit(limit):
+    """Return the page size of the limit parameter.\n
+    Raise QueryError if the limit is not a positive number."""
+
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise QueryError('limit must be a number!')
+
+    if limit <= 0:
+        raise QueryError('limit must be positive!')
+
+    return min(limit, MAX_PAGE_SIZE)
+
+def parseDepth(depth):
+    """Return the relationship depth of the depth parameter (None for no limit).\n
+    Raise QueryError if the depth is not a number."""
+
+    if depth is None:
+        return None
+
+    try:
+        depth = int(depth)
+    except ValueError:
+        raise QueryError('depth must be a number!')
+
+    if depth < 0:
+        raise QueryError('depth must not be negative!')
+
+    return depth
+
+def paginate(query, key, params):
+    """Return a page of the query using keyset pagination on key (no offset scans) and the cursor of the next page.\n
+    The page starts after the cursor parameter and has at most limit rows, without a limit all the rows are returned.\n
+    Example : paginate(Task.query, Task.id, {"limit" : "100", "cursor" : "MTIz"})"""
+
+    limit = params.get('limit')
+    cursor = params.get('cursor')
+
+    if cursor is not None:
+        query = query.filter(key > decodeCursor(cursor))
+
+    if limit is None:
+        if cursor is not None:
+            query = query.order_by(key)
+        return query.all(), None
+
+    limit = parseLimit(limit)
+
+    # Fetch one more row to know if there is a next page
+    rows = query.order_by(key).limit(limit + 1).all()
+
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+
+    return rows, encodeCursor(getattr(rows[-1], key.key))
+
+def queryPage(filters, model, fields=None, depth=None):
+    """Return a page of the serialized rows of any model and filters and the cursor of the next page (None on the last page).\n
+    The limit and cursor parameters of the filters select the page (see paginate).\n
+    Example : queryPage({"project.name" : "ProjectName", "limit" : "100", "fields" : "id,frame,job.id"}, Model)"""
+
+    query, serialize = serializeQuery(buildQuery(filters, model), filters, model, fields, depth)
+    rows, nextCursor = paginate(query, model.id, filters)
+
+    return [serialize(i) for i in rows], nextCursor
+
+def queryProjection(filters, model, columns):
+    """Return the page of rows of any model and filters as tuples of the id and some columns, and the cursor of the next page (see queryPage).\n
+    Nothing is serialized, the columns of related models must be joined by the filters (see buildQuery).\n
+    Example : queryProjection({"project.name" : "ProjectName"}, Task, [Projects.name.label('project_name'), Task.status])"""
+
+    return paginate(buildQuery(filters, model).with_entities(model.id, *columns), model.id, filters)
+
+def pageResponse(rows, nextCursor):
+    """Return the json response of a page, the cursor of the next page is sent in the X-Next-Cursor header"""
+
+    response = jsonify(rows)
+
+    if nextCursor is not None:
+        response.headers['X-Next-Cursor'] = nextCursor
+
+    return response
+
+def computeEtag(params, *values):
+    """Return the etag of a response from its request parameters and the values it depends on (with a stable repr).\n
+    Example : computeEtag(request.args, [(taskId, fingerprint)])"""
+
+    items = params.items(multi=True) if isinstance(params, MultiDict) else params.items()
+
+    return hashlib.sha1(repr((sorted(items), values)).encode()).hexdigest()
+
+def notModifiedResponse(etag):
+    """Return a 304 response if the client already has the etag (If-None-Match), else None"""
+
+    if request.if_none_match.contains(etag):
+        return setEtag(make_response('', 304), etag)
+
+    return None
+
+def setEtag(response, etag):
+    """Set the etag of a response"""
+
+    response.set_etag(etag)
+
+    return response
+
+def getRequest(filters, model):
+    """Return the json response of any model and filters.\n
+    The etag of the response is computed from a projection of the columns of the rows of the page (see queryProjection)
+    and checked before the page is loaded and serialized, so an unchanged page costs one cheap query and is not sent again.
+    Related rows are seen by the etag through the columns of the rows (foreign keys, updated_date, max_shape_id).\n
+    Example : getRequest({"project.name" : "ProjectName", "limit" : "100"}, Model)"""
+
+    try:
+        columns = [getattr(model, column.key) for column in inspect(model).column_attrs if column.key != 'id']
+        rows, nextCursor = queryProjection(filters, model, columns)
+        etag = computeEtag(filters, [tuple(row) for row in rows], nextCursor)
+        notModified = notModifiedResponse(etag)
+
+        if notModified is not None:
+            return notModified
+
+        return setEtag(pageResponse(*queryPage(filters, model)), etag)
+    except QueryError as e:
+        return jsonify({'message' : str(e)}), 400
 
 def get_frame_path(sname, pname):
     """Read corresponding frame for the task"""
@@ -60,30 +227,65 @@ def get_frame_path(sname, pname):
     return path
 
 def checkifAuthorize(pname, uid):
-    project_exist = getRequest({'name' : pname}, Projects)
-
-    project_exist = parseBytesToJson(project_exist.get_data())
+    project_exist = queryRows({'name' : pname}, Projects, fields='id')
 
-    result = getRequest({'project.name' : pname, 'user.id': str(uid)}, Projects_users)
+    result = queryRows({'project.name' : pname, 'user.id': str(uid)}, Projects_users, fields='id')
 
     project_splited = pname.split(',')
 
-    result = parseBytesToJson(result.get_data())
-    
     return (len(result) == len(project_splited) or bool(User.query.filter_by(id=uid, is_superuser=True).first())) and len(project_exist) != 0
 
-def parseBytesToJson(data):
-    """Return the json object from bytes object"""
-    jsonData=data.decode('utf8')
-    return json.loads(jsonData)
+def isAuthorized(pname, uid):
+    """Cached checkifAuthorize, see authorization_cache"""
+    key = (uid, pname)
+
+    if authorization_cache.get(key):
+        return True
+
+    authorized = checkifAuthorize(pname, uid)
+
+    # A refusal is not cached, so a user added to a project is authorized at once
+    if authorized:
+        authorization_cache.set(key, True)
+
+    return authorized
+
+def getUser(uid):
+    """Get a user by id, see user_cache
+    :param uid: id of the user
+    :return: the user as a CachedUser or None if it doesn't exist"""
+    user = user_cache.get(uid)
+
+    if user is None:
+        row = User.query.with_entities(User.id, User.username, User.is_superuser).filter_by(id=uid).first()
+
+        if row is not None:
+            user = CachedUser(*row)
+            user_cache.set(uid, user)
+
+    return user
+
+def invalidateUser(uid):
+    """Remove a user and its authorization decisions from the caches"""
+    user_cache.invalidate(uid)
+    authorization_cache.invalidateWhere(lambda key : key[0] == uid)
+
+def invalidateProject(pname):
+    """Remove the authorization decisions of a project from the cache"""
+    authorization_cache.invalidateWhere(lambda key : pname in key[1].split(','))
+
+def invalidateAuthCaches():
+    """Remove all the users and authorization decisions from the caches"""
+    user_cache.clear()
+    authorization_cache.clear()
 
 def getJobId(taskId):
     """Get the job id of a task
     :param taskId: id of a task
     :return: string of the job id
     """
-    segment = parseBytesToJson(getRequest({'task.id': str(taskId)}, Segment).get_data())[0]
-    job = parseBytesToJson(getRequest({'segment.id': str(segment['id'])}, Job).get_data())[0]
+    segment = queryRows({'task.id': str(taskId)}, Segment, fields='id')[0]
+    job = queryRows({'segment.id': str(segment['id'])}, Job, fields='id')[0]
 
     return str(job['id'])
 
@@ -1,5 +1,8 @@
 import boto3
+import botocore
 import os
+import threading
+import time
 
 s3_res = boto3.resource('s3', 
     endpoint_url= os.environ.get('AWS_S3_HOST'),
@@ -9,6 +12,12 @@ s3_res = boto3.resource('s3',
     verify=False)						 
 s3_cli = s3_res.meta.client
 
+# Seconds to keep the result of the bucket existence check
+BUCKET_CACHE_TTL = int(os.environ.get('S3_BUCKET_CACHE_TTL', 300))
+
+bucket_cache = {'exists': False, 'expires': 0}
+bucket_cache_lock = threading.Lock()
+
 def _get_frame_path(frame, base_dir):
     d1 = str(frame // 10000)
     d2 = str(frame // 100)
@@ -18,14 +27,45 @@ def _get_frame_path(frame, base_dir):
 
     return path
 
+def bucketExists():
+    """Check if CVAT_BUCKET exists, the result is cached for BUCKET_CACHE_TTL seconds"""
+    with bucket_cache_lock:
+        if time.time() >= bucket_cache['expires']:
+            response = s3_cli.list_buckets()
+            buckets = [bucket['Name'] for bucket in response['Buckets']]
+
+            bucket_cache['exists'] = bool(buckets) and os.environ.get('CVAT_BUCKET') in buckets
+            bucket_cache['expires'] = time.time() + BUCKET_CACHE_TTL
+
+        return bucket_cache['exists']
+
+def invalidateBucketCache():
+    """Check again if CVAT_BUCKET exists on the next call to bucketExists (when s3 answers NoSuchBucket)"""
+    with bucket_cache_lock:
+        bucket_cache['expires'] = 0
+
 def getFileUrl(path):
     # Check if bucket exists
-    response = s3_cli.list_buckets()
-    buckets = [bucket['Name'] for bucket in response['Buckets']]
-
-    if buckets and os.environ.get('CVAT_BUCKET') in buckets:
+    if bucketExists():
         url = s3_cli.generate_presigned_url(ClientMethod='get_object',
             Params={'Bucket':os.environ.get('CVAT_BUCKET'), 'Key':path},
             ExpiresIn=15)
         return url
     return ''
+
+def getFileContent(path):
+    """Get the content of a file directly from CVAT_BUCKET, without a presigned url
+    :param path: path of the file in the bucket
+    :return: the content of the file, None if it doesn't exist
+    """
+    try:
+        response = s3_cli.get_object(Bucket=os.environ.get('CVAT_BUCKET'), Key=path)
+    except botocore.exceptions.ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return None
+
+        if e.response['Error']['Code'] == 'NoSuchBucket':
+            invalidateBucketCache()
+        raise
+
+    return response['Body'].read()
@@ -0,0 +1,100 @@
+import datetime
+import threading
+from sqlalchemy import inspect
+from werkzeug.http import http_date
+
+# Compiled serializers by (model, fields, depth)
+serializers = {}
+serializers_lock = threading.Lock()
+
+def serializeDate(value):
+    """Serialize a date or datetime the way flask's json encoder does"""
+    if value is None:
+        return None
+    elif isinstance(value, datetime.datetime):
+        return http_date(value.utctimetuple())
+
+    return http_date(value.timetuple())
+
+def fieldsKey(fields):
+    """Get a hashable key of a fields tree (see planner.getFields)"""
+    if fields is None:
+        return None
+
+    return tuple(sorted((key, fieldsKey(value)) for key, value in fields.items()))
+
+def isDateColumn(column):
+    """Check if a column attribute holds dates or datetimes"""
+    try:
+        return issubclass(column.columns[0].type.python_type, datetime.date)
+    except NotImplementedError:
+        return False
+
+def compileSerializer(model, fields=None, depth=None):
+    """Generate the serializer function of a model
+    The public keys, relationships and date columns are resolved once, so the generated function
+    only reads the attributes of the row.
+    :param model: the model class
+    :param fields: tree of the fields to serialize (see planner.getFields), None for all the public keys
+    :param depth: maximum number of relationships to follow, None for no limit
+    :return: function of a row (or None) -> dictionary
+    """
+    mapper = inspect(model)
+    blacklist = ['_sa_instance_state'] + list(getattr(model, '_serialize_blacklist', []))
+    namespace = {'serializeDate' : serializeDate}
+    items = []
+
+    for i, k in enumerate(model.__public__):
+        if k in blacklist or (fields is not None and k not in fields):
+            continue
+
+        # Loaded attributes are read from the state of the row, the others are loaded by the attribute
+        value = 'values[{0!r}] if {0!r} in values else getattr(row, {0!r})'.format(k)
+
+        if k in mapper.relationships:
+            # Relationships deeper than depth are not loaded
+            if depth is not None and depth <= 0:
+                continue
+
+            relationship = mapper.relationships[k]
+            serializer = 'serializer{0}'.format(i)
+            namespace[serializer] = getSerializer(relationship.mapper.class_,
+                                                  None if fields is None else fields[k],
+                                                  None if depth is None else depth - 1)
+
+            if relationship.uselist:
+                value = '[{0}(i) for i in ({1})]'.format(serializer, value)
+            else:
+                value = '{0}({1})'.format(serializer, value)
+        elif k in mapper.column_attrs and isDateColumn(mapper.column_attrs[k]):
+            value = 'serializeDate({0})'.format(value)
+
+        items.append('        {0!r} : {1},'.format(k, value))
+
+    source = '\n'.join(['def serialize(row):',
+                        '    if row is None:',
+                        '        return None',
+                        '    values = row.__dict__',
+                        '    return {'] + items + ['    }'])
+
+    exec(compile(source, '<serializer of {0}>'.format(model.__name__), 'exec'), namespace)
+
+    return namespace['serialize']
+
+def getSerializer(model, fields=None, depth=None):
+    """Get the compiled serializer of a model (see compileSerializer)"""
+    key = (model, fieldsKey(fields), depth)
+    serializer = serializers.get(key)
+
+    if serializer is None:
+        serializer = compileSerializer(model, fields, depth)
+
+        with serializers_lock:
+            serializers[key] = serializer
+
+    return serializer
+
+def compileAll(models):
+    """Compile the serializers of all the public keys of models"""
+    for model in models:
+        getSerializer(model)
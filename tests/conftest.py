@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The modules of the api are imported from the root of the repository
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# app builds the database uri from the environment when it is imported (nothing connects to it in the tests)
+for name in ['DB_USER', 'DB_PASSWORD', 'DB_HOST_IP', 'DB_NAME']:
+    os.environ.setdefault(name, 'test')
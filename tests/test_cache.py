@@ -0,0 +1,111 @@
+import pytest
+
+import cache
+from cache import TTLCache
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Fake time of the cache, moved by setting clock[0]"""
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, 'time', lambda : now[0])
+
+    return now
+
+def test_get_set():
+    entries = TTLCache(maxsize=10, ttl=60)
+    entries.set('a', 1)
+
+    assert entries.get('a') == 1
+    assert entries.get('b') is None
+    assert entries.get('b', 2) == 2
+    assert entries.stats['hits'] == 1
+    assert entries.stats['misses'] == 2
+
+def test_falsy_values_are_cached():
+    entries = TTLCache(maxsize=10, ttl=60)
+    entries.set('a', False)
+
+    assert entries.get('a', 'missing') is False
+
+def test_entries_expire(clock):
+    entries = TTLCache(maxsize=10, ttl=60)
+    entries.set('a', 1)
+
+    clock[0] += 59
+    assert entries.get('a') == 1
+
+    clock[0] += 1
+    assert entries.get('a') is None
+    assert entries.stats['size'] == 0
+
+def test_set_again_restarts_ttl(clock):
+    entries = TTLCache(maxsize=10, ttl=60)
+    entries.set('a', 1)
+
+    clock[0] += 50
+    entries.set('a', 2)
+
+    clock[0] += 50
+    assert entries.get('a') == 2
+
+def test_least_recently_used_is_evicted():
+    entries = TTLCache(maxsize=2, ttl=60)
+    entries.set('a', 1)
+    entries.set('b', 2)
+    entries.get('a')
+    entries.set('c', 3)
+
+    assert entries.get('a') == 1
+    assert entries.get('b') is None
+    assert entries.get('c') == 3
+
+def test_weight_evicts_until_it_fits():
+    entries = TTLCache(maxsize=10, ttl=60, maxweight=10)
+    entries.set('a', 1, weight=4)
+    entries.set('b', 2, weight=4)
+    entries.set('c', 3, weight=4)
+
+    assert entries.get('a') is None
+    assert entries.get('b') == 2
+    assert entries.get('c') == 3
+    assert entries.stats['weight'] == 8
+
+def test_heavier_than_the_cache_is_not_kept():
+    entries = TTLCache(maxsize=10, ttl=60, maxweight=10)
+    entries.set('a', 1, weight=4)
+    entries.set('b', 2, weight=11)
+
+    assert entries.get('a') == 1
+    assert entries.get('b') is None
+    assert entries.stats['weight'] == 4
+
+def test_replacing_updates_the_weight():
+    entries = TTLCache(maxsize=10, ttl=60, maxweight=10)
+    entries.set('a', 1, weight=4)
+    entries.set('a', 2, weight=6)
+
+    assert entries.stats['weight'] == 6
+    assert entries.stats['size'] == 1
+
+def test_invalidate():
+    entries = TTLCache(maxsize=10, ttl=60, maxweight=10)
+    entries.set((1, 'p1'), True, weight=2)
+    entries.set((1, 'p2'), True, weight=2)
+    entries.set((2, 'p1,p2'), True, weight=2)
+
+    entries.invalidate((1, 'p1'))
+    entries.invalidate('missing')
+    assert entries.get((1, 'p1')) is None
+    assert entries.stats['weight'] == 4
+
+    entries.invalidateWhere(lambda key : 'p2' in key[1].split(','))
+    assert entries.stats['size'] == 0
+    assert entries.stats['weight'] == 0
+
+def test_clear():
+    entries = TTLCache(maxsize=10, ttl=60, maxweight=10)
+    entries.set('a', 1, weight=3)
+    entries.clear()
+
+    assert entries.get('a') is None
+    assert entries.stats['weight'] == 0
@@ -0,0 +1,116 @@
+import random
+from collections import namedtuple
+
+import pytest
+
+from api import interpolation
+from benchmarks.interpolation_benchmark import TrackedBoxRow, generateRows, legacyTrackedBox
+
+TrackedPointsRow = namedtuple('TrackedPointsRow', ['id', 'frame', 'outside', 'points', 'track_id', 'label'])
+
+def box(boxId, frame, outside, xtl, trackId=1, label='car'):
+    return TrackedBoxRow(boxId, frame, outside, xtl, xtl + 1.0, xtl + 10.0, xtl + 20.0, trackId, label)
+
+def trackedBoxes(rows, attributes, size):
+    keyFrames = interpolation.trackedBoxKeyFrames(rows, attributes)
+
+    return list(interpolation.boxesToDicts(keyFrames, interpolation.interpolateBoxes(keyFrames, size)))
+
+def trackedPoints(rows, attributes, size):
+    keyFrames = interpolation.trackedPointsKeyFrames(rows, attributes)
+    completed = interpolation.interpolatePoints(keyFrames, size)
+
+    return list(interpolation.pointsToDicts(keyFrames, completed, lambda coordinates : coordinates))
+
+def legacy(rows, attributes, size):
+    # The previous implementation mutates the properties of its key frames
+    return legacyTrackedBox(rows, {boxId : dict(props) for boxId, props in attributes.items()}, size)
+
+@pytest.mark.parametrize('seed', range(5))
+def test_boxes_match_the_previous_implementation(seed):
+    random.seed(seed)
+    rows, attributes = generateRows(20, 6, 300)
+
+    assert trackedBoxes(rows, attributes, 300) == legacy(rows, attributes, 300)
+
+def test_outside_key_frames():
+    # Visible at 0, outside at 5, visible again at 10 and outside at 15: the boxes until 5 move towards
+    # the outside key frame, nothing is visible from 5 to 9 and after 15
+    rows = [box(1, 0, False, 0.0), box(2, 5, True, 50.0), box(3, 10, False, 100.0), box(4, 15, True, 150.0)]
+    attributes = {1 : {'color' : 'red'}, 3 : {'size' : 'big'}}
+    boxes = trackedBoxes(rows, attributes, 30)
+
+    assert boxes == legacy(rows, attributes, 30)
+    assert [b['frame'] for b in boxes] == [0, 1, 2, 3, 4, 10, 11, 12, 13, 14]
+    assert [b['box']['xtl'] for b in boxes[:5]] == [0.0, 10.0, 20.0, 30.0, 40.0]
+    assert boxes[5]['properties'] == {'color' : 'red', 'size' : 'big'}
+    assert 'properties' not in boxes[6]
+
+def test_last_key_frame_holds_until_the_end():
+    rows = [box(1, 2, False, 0.0), box(2, 4, False, 40.0)]
+    attributes = {2 : {'color' : 'blue'}}
+    boxes = trackedBoxes(rows, attributes, 8)
+
+    assert boxes == legacy(rows, attributes, 8)
+    assert [b['frame'] for b in boxes] == [2, 3, 4, 5, 6, 7]
+    assert [b['box']['xtl'] for b in boxes] == [0.0, 20.0, 40.0, 40.0, 40.0, 40.0]
+    assert all(b['properties'] == {'color' : 'blue'} for b in boxes[2:])
+
+def test_key_frame_at_the_end_of_the_video():
+    rows = [box(1, 0, False, 0.0), box(2, 9, False, 90.0)]
+    boxes = trackedBoxes(rows, {}, 10)
+
+    assert boxes == legacy(rows, {}, 10)
+    assert boxes[-1]['frame'] == 9
+
+def test_several_tracks_are_completed_independently():
+    rows = [box(1, 0, False, 0.0, trackId=2, label='bus'), box(2, 1, False, 0.0, trackId=1), box(3, 3, False, 30.0, trackId=1)]
+    boxes = trackedBoxes(rows, {}, 5)
+
+    assert sorted(boxes, key=lambda b : (b['track_id'], b['frame'])) == \
+           sorted(legacy(rows, {}, 5), key=lambda b : (b['track_id'], b['frame']))
+    assert {b['class'] for b in boxes if b['track_id'] == 2} == {'bus'}
+
+def test_no_key_frames():
+    assert trackedBoxes([], {}, 10) == []
+    assert trackedPoints([], {}, 10) == []
+
+def test_track_only_outside():
+    rows = [box(1, 3, True, 0.0)]
+
+    assert trackedBoxes(rows, {}, 10) == legacy(rows, {}, 10) == []
+
+def test_points_move_when_the_vertex_count_is_the_same():
+    rows = [TrackedPointsRow(1, 0, False, '0,0 10,0', 1, 'line'), TrackedPointsRow(2, 2, False, '10,10 20,10', 1, 'line')]
+    shapes = trackedPoints(rows, {}, 4)
+
+    assert [shape['frame'] for shape in shapes] == [0, 1, 2, 3]
+    assert [shape['geometry'] for shape in shapes] == [[[0.0, 0.0], [10.0, 0.0]],
+                                                       [[5.0, 5.0], [15.0, 5.0]],
+                                                       [[10.0, 10.0], [20.0, 10.0]],
+                                                       [[10.0, 10.0], [20.0, 10.0]]]
+
+def test_points_hold_when_the_vertex_count_changes():
+    rows = [TrackedPointsRow(1, 0, False, '0,0 10,0', 1, 'line'), TrackedPointsRow(2, 3, False, '10,10 20,10 30,10', 1, 'line')]
+    shapes = trackedPoints(rows, {}, 5)
+
+    assert [shape['geometry'] for shape in shapes[:3]] == [[[0.0, 0.0], [10.0, 0.0]]] * 3
+    assert [shape['geometry'] for shape in shapes[3:]] == [[[10.0, 10.0], [20.0, 10.0], [30.0, 10.0]]] * 2
+
+def test_points_outside_and_properties():
+    rows = [TrackedPointsRow(1, 0, False, '0,0 2,2 4,0', 1, 'area'), TrackedPointsRow(2, 2, True, '2,0 4,2 6,0', 1, 'area')]
+    shapes = trackedPoints(rows, {1 : {'kind' : 'a'}}, 6)
+
+    assert [shape['frame'] for shape in shapes] == [0, 1]
+    assert shapes[1]['geometry'] == [[1.0, 0.0], [3.0, 2.0], [5.0, 0.0]]
+    assert shapes[0]['properties'] == {'kind' : 'a'}
+    assert 'properties' not in shapes[1]
+
+def test_track_spans():
+    rows = [box(1, 0, False, 0.0), box(2, 5, True, 50.0), box(3, 10, False, 100.0), box(4, 12, False, 120.0)]
+    keyFrames = interpolation.trackedBoxKeyFrames(rows, {})
+    tracks = list(interpolation.boxTracksToDicts(keyFrames, 20))
+
+    assert len(tracks) == 1
+    assert tracks[0]['spans'] == [[0, 5], [10, 20]]
+    assert [keyFrame['frame'] for keyFrame in tracks[0]['keyframes']] == [0, 5, 10, 12]
@@ -0,0 +1,90 @@
+import io
+
+import pytest
+from werkzeug.datastructures import FileStorage
+from werkzeug.formparser import parse_form_data
+
+from api import multipart
+from api.multipart import MultipartStream
+
+def uploadedFile(content, filename):
+    return FileStorage(stream=io.BytesIO(content), filename=filename)
+
+def parse(body, stream):
+    """Parse a multipart body like the server of the request does"""
+    environ = {
+        'REQUEST_METHOD' : 'POST',
+        'CONTENT_TYPE' : stream.content_type,
+        'CONTENT_LENGTH' : str(len(body)),
+        'wsgi.input' : io.BytesIO(body)
+    }
+
+    _, form, files = parse_form_data(environ)
+
+    return form, files
+
+def test_fields_and_files_are_sent():
+    video = bytes(range(256)) * 100
+    stream = MultipartStream({'name' : 'task', 'score' : 3},
+                             [('client_files[0]', uploadedFile(video, 'video.mp4')),
+                              ('client_files[1]', uploadedFile(b'', 'empty.txt'))])
+    body = stream.read()
+    form, files = parse(body, stream)
+
+    assert form['name'] == 'task'
+    assert form['score'] == '3'
+    assert files['client_files[0]'].filename == 'video.mp4'
+    assert files['client_files[0]'].content_type == 'video/mp4'
+    assert files['client_files[0]'].read() == video
+    assert files['client_files[1]'].read() == b''
+
+def test_length_is_the_size_of_the_body():
+    stream = MultipartStream({'a' : 'é'}, [('file', uploadedFile(b'x' * 1000, 'a.bin'))])
+
+    assert len(stream) == len(stream.read())
+    assert stream.read() == b''
+
+@pytest.mark.parametrize('size', [1, 7, 64, 100000])
+def test_read_by_blocks(size):
+    content = b'0123456789' * 1000
+    expected = MultipartStream({'a' : 'b'}, [('file', uploadedFile(content, 'a.bin'))], boundary='x').read()
+    stream = MultipartStream({'a' : 'b'}, [('file', uploadedFile(content, 'a.bin'))], boundary='x')
+
+    blocks = []
+
+    while True:
+        block = stream.read(size)
+
+        if not block:
+            break
+
+        assert len(block) <= size
+        blocks.append(block)
+
+    assert b''.join(blocks) == expected
+
+def test_iteration_yields_chunks(monkeypatch):
+    monkeypatch.setattr(multipart, 'CHUNK_SIZE', 100)
+    content = b'y' * 1000
+    expected = MultipartStream({}, [('file', uploadedFile(content, 'a.bin'))], boundary='x').read()
+    chunks = list(MultipartStream({}, [('file', uploadedFile(content, 'a.bin'))], boundary='x'))
+
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert b''.join(chunks) == expected
+
+def test_file_is_sent_from_its_start():
+    uploaded = uploadedFile(b'content', 'a.bin')
+    uploaded.stream.read()
+    stream = MultipartStream({}, [('file', uploaded)])
+    _, files = parse(stream.read(), stream)
+
+    assert files['file'].read() == b'content'
+
+def test_names_are_quoted():
+    stream = MultipartStream({'a"b' : 'c'}, [('file', uploadedFile(b'1', 'my "video"\r\n.mp4'))])
+    body = stream.read()
+    form, files = parse(body, stream)
+
+    assert b'filename="my %22video%22%0D%0A.mp4"' in body
+    assert form['a%22b'] == 'c'
+    assert files['file'].read() == b'1'
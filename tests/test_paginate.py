@@ -0,0 +1,105 @@
+import pytest
+from sqlalchemy import create_engine, Column, Integer, String
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import Session
+
+import requestsApi as rqApi
+from planner import QueryError
+
+Base = declarative_base()
+
+class Row(Base):
+    __tablename__ = 'rows'
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+
+# Ids with gaps, inserted out of order
+IDS = [3, 1, 8, 2, 21, 13, 5, 34]
+
+@pytest.fixture
+def session():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    session = Session(engine)
+    session.add_all([Row(id=rowId, name='row' + str(rowId)) for rowId in IDS])
+    session.commit()
+
+    yield session
+
+    session.close()
+
+def pages(session, params):
+    """Follow the cursors from the first page to the last one"""
+    params = dict(params)
+    result = []
+
+    while True:
+        rows, nextCursor = rqApi.paginate(session.query(Row), Row.id, params)
+        result.append([row.id for row in rows])
+
+        if nextCursor is None:
+            return result
+
+        params['cursor'] = nextCursor
+
+@pytest.mark.parametrize('limit', [1, 2, 3, 7, 8, 100])
+def test_cursors_go_through_all_the_rows(session, limit):
+    result = pages(session, {'limit' : str(limit)})
+
+    assert sum(result, []) == sorted(IDS)
+    assert all(len(page) == limit for page in result[:-1])
+    assert 0 < len(result[-1]) <= limit
+
+def test_last_full_page_has_no_cursor(session):
+    rows, nextCursor = rqApi.paginate(session.query(Row), Row.id, {'limit' : '8'})
+
+    assert len(rows) == 8
+    assert nextCursor is None
+
+def test_without_limit_all_the_rows_are_returned(session):
+    rows, nextCursor = rqApi.paginate(session.query(Row), Row.id, {})
+
+    assert sorted(row.id for row in rows) == sorted(IDS)
+    assert nextCursor is None
+
+def test_cursor_without_limit_returns_the_rest(session):
+    rows, nextCursor = rqApi.paginate(session.query(Row), Row.id, {'cursor' : rqApi.encodeCursor(5)})
+
+    assert [row.id for row in rows] == [8, 13, 21, 34]
+    assert nextCursor is None
+
+def test_cursor_of_a_deleted_row(session):
+    _, nextCursor = rqApi.paginate(session.query(Row), Row.id, {'limit' : '3'})
+    session.query(Row).filter(Row.id == 3).delete()
+    session.commit()
+
+    rows, _ = rqApi.paginate(session.query(Row), Row.id, {'limit' : '3', 'cursor' : nextCursor})
+
+    assert [row.id for row in rows] == [5, 8, 13]
+
+def test_pages_of_a_filtered_query(session):
+    params = {'limit' : '2'}
+    rows, nextCursor = rqApi.paginate(session.query(Row).filter(Row.id > 4), Row.id, params)
+    assert [row.id for row in rows] == [5, 8]
+
+    rows, nextCursor = rqApi.paginate(session.query(Row).filter(Row.id > 4), Row.id, dict(params, cursor=nextCursor))
+    assert [row.id for row in rows] == [13, 21]
+
+def test_limit_is_bounded(session, monkeypatch):
+    monkeypatch.setattr(rqApi, 'MAX_PAGE_SIZE', 3)
+
+    assert pages(session, {'limit' : '1000'}) == [[1, 2, 3], [5, 8, 13], [21, 34]]
+
+@pytest.mark.parametrize('key', [0, 1, 123456789012])
+def test_cursor_round_trip(key):
+    assert rqApi.decodeCursor(rqApi.encodeCursor(key)) == key
+
+@pytest.mark.parametrize('cursor', ['', 'not a cursor', rqApi.encodeCursor('abc'), 'é'])
+def test_invalid_cursor(session, cursor):
+    with pytest.raises(QueryError):
+        rqApi.paginate(session.query(Row), Row.id, {'limit' : '2', 'cursor' : cursor})
+
+@pytest.mark.parametrize('limit', ['0', '-1', 'ten'])
+def test_invalid_limit(session, limit):
+    with pytest.raises(QueryError):
+        rqApi.paginate(session.query(Row), Row.id, {'limit' : limit})